@@ -1,23 +1,25 @@
 import math
-from dimod import BinaryQuadraticModel, make_quadratic, quicksum
-from dwave.samplers import PathIntegralAnnealingSampler, SimulatedAnnealingSampler
-from qiskit_optimization import QuadraticProgram
-from qaoa import QAOAOptimiser
-from util import square_bqm_to_binary_polynomial
+import numpy as np
+from dimod import BinaryQuadraticModel, quicksum
+from benefits import as_benefits
+from labels import LabelCodec
+from util import QuadraticBlock, square_linear_block, sum_bqms
 
 BINARY_VARTYPE = 'BINARY'
 SAFETY_FACTOR = 1
 
-def create_slack_variables(name, S_max):
+def create_slack_variables(name, S_max, codec=None, **fields):
     """
     Create a BQM representing a binary-encoded slack variable with value in [0, S_max].
     The variable decomposes as sum_{k=0}^{floor(log2(S_max))} 2^k * s_k.
+    The bits are named f'{name}-{k}', or with a LabelCodec, labelled
+    codec.encode(name, bit=k, **fields), where name is the kind of slack.
     """
     if S_max < 1:
         raise ValueError(f"S_max must be >= 1, got {S_max}")
     model = BinaryQuadraticModel('BINARY')
     for j in range(0, math.floor(math.log2(S_max)) + 1):
-        model.add_linear(f'{name}-{j}', 2**j)
+        model.add_linear(f'{name}-{j}' if codec is None else codec.encode(name, bit=j, **fields), 2**j)
     return model
 
 
@@ -63,28 +65,56 @@ def omega(Q, U, I, c, f, n_replicas):
     return cost
 
 
+def benefit_terms(v, Q, U, I, f):
+    """
+    The frequency-weighted benefits of the candidates I, for the query
+    templates Q pair by pair and summed over the update templates U. Only
+    the stored benefits are read.
+
+    Returns
+    -------
+    rows_i, rows_q  : the positions in I and Q of every (candidate, query template) pair with a benefit
+    query_benefits  : f(q) * v_i^q for those pairs
+    update_benefits : -sum_u f(u) * v_i^u for every candidate in I
+    """
+    position_i = np.full(len(v), -1)
+    position_i[I] = np.arange(len(I))
+    position_q = np.full(v.n_templates, -1)
+    position_q[Q] = np.arange(len(Q))
+    is_update = np.zeros(v.n_templates, dtype=bool)
+    is_update[U] = True
+    entry_i, entry_t, entry_v = v.coo()
+    query_entries = (position_i[entry_i] >= 0) & (position_q[entry_t] >= 0)
+    rows_i, rows_q = position_i[entry_i[query_entries]], position_q[entry_t[query_entries]]
+    query_benefits = entry_v[query_entries] * f[entry_t[query_entries]]
+    update_entries = (position_i[entry_i] >= 0) & is_update[entry_t]
+    update_benefits = -np.bincount(position_i[entry_i[update_entries]], entry_v[update_entries] * f[entry_t[update_entries]],
+                                   minlength=len(I))
+    return rows_i, rows_q, query_benefits, update_benefits
+
+
 def make_max_cost_qubo(Z_max, n_replicas, Q, U, I, c, f, v, m, alpha,
-                       additional_constraints=None):
+                             additional_constraints=None, codec=None):
     """
-    Build a QUBO for the divergent design tuning problem on a maximum cost basis.
-
-    Lambda calibration strategy
-    ---------------------------
-    All penalty lambdas are derived from the assembled objective BQM's
-    coefficient structure AFTER it is built, not from the raw problem
-    parameters. This ensures correct scaling regardless of normalisation.
-
-    lam_replica  : enforces z^(0) >= load_r for each replica r.
-                   Multiplier=2 allows near-optimal feasible solutions to
-                   remain distinguishable while enforcing feasibility.
-
-    lam_routing  : hard constraint enforcing sum_r t_q^r = m.
-                   Multiplier scales with n_replicas * |Q| so it dominates
-                   the replica-load terms regardless of problem size.
-                   This is the constraint that must never be violated.
+    Build a QUBO for the divergent design tuning problem on a maximum cost
+    basis, from coefficient arrays.
+
+    The replica load constraints differ only in their variables, so one
+    canonical load constraint is computed from the baseline and benefit
+    matrices, squared and quadratised in closed form by square_linear_block,
+    and stamped out over the variables of every replica; the failure load
+    constraints and the routing constraints are stamped out the same way.
+    Nothing is built term by term or reduced with make_quadratic. Each x*t
+    auxiliary variable belongs to one load constraint and has a single
+    penalty (returned as the 'products' component).
+
+    lam_replica enforces z >= load_r for each replica r, and lam_routing
+    the hard constraint sum_r t_q^r = m, which must never be violated.
+
+    The variables are labelled by `codec` (a new LabelCodec if not given)
+    rather than named; codec.name gives their names.
     """
     assert alpha <= 1, 'the convex combination over all probabilities must total 1'
-    # Sanity check: Z_max should be achievable by a single replica
     max_single_replica_load = sum(f[q] * c[q] / m for q in Q)
     if Z_max > max_single_replica_load * 2:
         import warnings
@@ -95,148 +125,75 @@ def make_max_cost_qubo(Z_max, n_replicas, Q, U, I, c, f, v, m, alpha,
         )
     if additional_constraints is None:
         additional_constraints = []
-
-    # Build the objective BQM: min z^(0) = sum_k 2^k z_k
-    objective = create_slack_variables('z', Z_max)
-
-    # build the failure terms z^(j)
+    if codec is None:
+        codec = LabelCodec()
+    Q, U, I = list(Q), list(U), list(I)
+    c = np.asarray(c, dtype=float)
+    f = np.asarray(f, dtype=float)
+    v = as_benefits(v, len(c))
+
+    objective = create_slack_variables('z', Z_max, codec)
     subobjectives = []
     if alpha > 0:
         for r in range(n_replicas):
-            subobjective = create_slack_variables(f'z^({r})', Z_max)
-            subobjectives.append(subobjective)
+            subobjectives.append(create_slack_variables('z', Z_max, codec, j=r))
 
-    # lam_replica: must dominate the objective range.
     lam_replica = omega(Q, U, I, c, f, n_replicas) * SAFETY_FACTOR
-
-    replica_load_bqms = []
-    routing_bqms = []
-
-    # Per-replica load constraints.
-    # Encodes: z^(0) - sum_q qcost(q, I_r) - sum_u ucost(u, I_r) - s^(r) = 0
-    for r in range(n_replicas):
-        constraint_model = BinaryQuadraticModel('BINARY')
-
-        # z^(0) terms
-        for var, bias in objective.iter_linear():
-            constraint_model.add_linear(var, bias)
-
-        # Query cost: -f(q)/m * c_q * t_q^r  and  -f(q)/m * v_i^q * x_i^r * t_q^r
-        for q in Q:
-            constraint_model.add_linear(f't-q{q}-r{r}', -f[q] * c[q] / m)
-            for i in I:
-                constraint_model.add_quadratic(
-                    f'x-i{i}-r{r}', f't-q{q}-r{r}',
-                    f[q] * v[i][q] / m
-                )
-
-        # Update cost: constant offset and -f(u)*v_i^u * x_i^r linear terms
-        for u in U:
-            constraint_model.offset += -f[u] * c[u]
-            for i in I:
-                constraint_model.add_linear(f'x-i{i}-r{r}', -f[u] * v[i][u])
-
-        # Slack s^(r) in [0, Z_max] absorbs z^(0) - load_r
-        for var, bias in create_slack_variables(f's-r{r}', Z_max).iter_linear():
-            constraint_model.add_linear(var, -bias)
-
-        # The make_quadratic reduction strength must exceed the largest
-        # coefficient in the expression being squared.
-        max_coeff = max(
-            (abs(b) for _, b in constraint_model.iter_linear()), default=1.0
-        )
-        hubo = square_bqm_to_binary_polynomial(constraint_model)
-        qubo = make_quadratic(hubo, 2.0 * max_coeff, 'BINARY')
-        qubo.scale(lam_replica)
-        replica_load_bqms.append(qubo)
-
-    # lam_routing must dominate the replica_load terms, not just the objective.
-    # The replica_load BQMs are already scaled by lam_replica and involve
-    # O(|I|*|Q|) variables whose squared interactions can be enormous.
-    # Deriving lam_routing from the assembled replica_load BQM ensures it
-    # genuinely outweighs whatever energy the annealer gains by violating routing.
-    replica_load_combined = quicksum(replica_load_bqms) if replica_load_bqms else BinaryQuadraticModel('BINARY')
     lam_routing = (omega(Q, U, I, c, f, n_replicas) ** 3) + 1 * SAFETY_FACTOR
 
-    # failure-aware replica load terms
+    n_bits = math.floor(math.log2(Z_max)) + 1
+    bits = 2.0 ** np.arange(n_bits)
+    # the parts of every load that do not depend on the replica
+    query_costs = -f[Q] * c[Q]
+    update_costs = -float((f[U] * c[U]).sum()) if U else 0.0
+    rows_i, rows_q, query_benefits, update_benefits = benefit_terms(v, Q, U, I, f)
+    # a load constraint's variables: z bits, t, x, s bits, then the x*t products
+    pairs = np.stack([n_bits + len(Q) + rows_i, n_bits + rows_q], axis=1)
+    pair_templates, pair_candidates = np.asarray(Q)[rows_q].tolist(), np.asarray(I)[rows_i].tolist()
+
+    def load_block(divisor):
+        """ z - sum_q qcost(q, I_r) - sum_u ucost(u, I_r) - s = 0, squared and scaled by lam_replica """
+        a = np.concatenate([bits, query_costs / divisor, update_benefits, -bits])
+        return square_linear_block(a, update_costs, pairs, query_benefits / divisor, 2.0 * np.abs(a).max(), lam_replica)
+
+    def load_labels(r, j):
+        return ([codec.encode('z', j=j, bit=k) for k in range(n_bits)] + [codec.t(q, r, j) for q in Q] +
+                [codec.x(i, r) for i in I] + [codec.encode('s', r=r, j=j, bit=k) for k in range(n_bits)] +
+                [codec.encode('p', q=q, i=i, r=r, j=j) for q, i in zip(pair_templates, pair_candidates)])
+
+    def routing_block(n, target):
+        """ (sum of n variables - target)^2, scaled by lam_routing """
+        return square_linear_block(np.ones(n), -target, scale=lam_routing)[0]
+
+    replica_load, replica_penalty = load_block(m)
+    replica_labels = [load_labels(r, -1) for r in range(n_replicas)]
+    replica_load_combined = replica_load.stamp(replica_labels)
+    penalties = [replica_penalty.stamp(replica_labels)]
+
     failure_bqms = []
     failure_routing_bqms = []
     if alpha > 0:
-        for j in range(n_replicas):
-            for r in range(n_replicas):
-                if j == r: continue
-
-                constraint_model = BinaryQuadraticModel('BINARY')
-                # z^(j) terms
-                for var, bias in subobjectives[j].iter_linear():
-                    constraint_model.add_linear(var, bias)
-                
-                # Query cost: -f(q)/min{m, |R|-1} * c_q * t_q^(r,j)  and  -f(q)/min{m, |R|-1} * v_i^q * x_i^r * t_q^(r,j)
-                for q in Q:
-                    constraint_model.add_linear(f't-q{q}-r{r}-j{j}', -f[q] * c[q] / min(m, n_replicas - 1))
-                    for i in I:
-                        constraint_model.add_quadratic(
-                            f'x-i{i}-r{r}', f't-q{q}-r{r}-j{j}',
-                            f[q] * v[i][q] / min(m, n_replicas - 1)
-                        )
-
-                # Update cost: constant offset and -f(u)*v_i^u * x_i^r linear terms
-                for u in U:
-                    constraint_model.offset += -f[u] * c[u]
-                    for i in I:
-                        constraint_model.add_linear(f'x-i{i}-r{r}', -f[u] * v[i][u])
-
-                # Slack s^(r) in [0, Z_max] absorbs z^(0) - load_r
-                for var, bias in create_slack_variables(f's-j{j}-r{r}', Z_max).iter_linear():
-                    constraint_model.add_linear(var, -bias)
-
-                # The make_quadratic reduction strength must exceed the largest
-                # coefficient in the expression being squared.
-                max_coeff = max(
-                    (abs(b) for _, b in constraint_model.iter_linear()), default=1.0
-                )
-                hubo = square_bqm_to_binary_polynomial(constraint_model)
-                qubo = make_quadratic(hubo, 2.0 * max_coeff, 'BINARY')
-                qubo.scale(lam_replica)
-                failure_bqms.append(qubo)
-        
-        # failure routing constraints
-        for q in Q:
-            for j in range(n_replicas):
-                constraint_model = BinaryQuadraticModel('BINARY')
-                for r in range(n_replicas):
-                    if j == r: continue
-                    constraint_model.add_linear(f't-q{q}-r{r}-j{j}', 1)
-                constraint_model.offset = -min(m, n_replicas - 1)
-                hubo = square_bqm_to_binary_polynomial(constraint_model)
-                qubo = make_quadratic(hubo, 1.0, 'BINARY')
-                qubo.scale(lam_routing)
-                failure_routing_bqms.append(qubo)
-
-    # Hard routing constraint: lambda_routing * (sum_r t_q^r - m)^2
-    for q in Q:
-        constraint_model = BinaryQuadraticModel('BINARY')
-        for r in range(n_replicas):
-            constraint_model.add_linear(f't-q{q}-r{r}', 1)
-        constraint_model.offset = -m
-        hubo = square_bqm_to_binary_polynomial(constraint_model)
-        qubo = make_quadratic(hubo, 1.0, 'BINARY')
-        qubo.scale(lam_routing)
-        routing_bqms.append(qubo)
+        failure_load, failure_penalty = load_block(min(m, n_replicas - 1))
+        failure_labels = [load_labels(r, j) for j in range(n_replicas) for r in range(n_replicas) if r != j]
+        failure_bqms.append(failure_load.stamp(failure_labels))
+        penalties.append(failure_penalty.stamp(failure_labels))
+        failure_routing_bqms.append(routing_block(n_replicas - 1, min(m, n_replicas - 1)).stamp(
+            [[codec.t(q, r, j) for r in range(n_replicas) if r != j] for q in Q for j in range(n_replicas)]))
 
-    # Merge routing BQMs into one for decomposition reporting
-    routing_combined = quicksum(routing_bqms) if routing_bqms else BinaryQuadraticModel('BINARY')
+    routing_combined = routing_block(n_replicas, m).stamp([[codec.t(q, r) for r in range(n_replicas)] for q in Q])
 
-    # scale the objective according to the failure probability
     objective.scale(1 - alpha)
     for subobjective in subobjectives:
         subobjective.scale(alpha / n_replicas)
 
-    full_qubo = quicksum([objective, *subobjectives, *replica_load_bqms, *routing_bqms, *failure_bqms, *failure_routing_bqms, *additional_constraints])
+    product_penalties = sum_bqms(penalties)
+    full_qubo = sum_bqms([objective, *subobjectives, replica_load_combined, routing_combined, *failure_bqms, *failure_routing_bqms,
+                          product_penalties, *additional_constraints])
 
     components = {
         'replica_load': replica_load_combined,
         'routing':      routing_combined,
+        'products':     product_penalties,
         'lam_replica':  lam_replica,
         'lam_routing':  lam_routing,
     }
@@ -247,42 +204,36 @@ def make_max_cost_qubo(Z_max, n_replicas, Q, U, I, c, f, v, m, alpha,
 
 
 def make_total_cost_qubo(n_replicas, Q, U, I, c, f, v, m,
-                         additional_constraints=None):
+                         additional_constraints=None, codec=None):
     """
     Build a QUBO for the divergent design tuning problem on a total cost basis.
+    The objective of one replica is built once, from the baseline and
+    benefit matrices, and stamped out over the variables of every replica;
+    likewise the routing constraint of one query template.
+    The variables are labelled by `codec` (a new LabelCodec if not given).
     """
     if additional_constraints is None:
         additional_constraints = []
-
-    objective = BinaryQuadraticModel('BINARY')
-    for r in range(n_replicas):
-        for q in Q:
-            objective.add_linear(f't-q{q}-r{r}', -f[q] * c[q] / m)
-            for i in I:
-                objective.add_quadratic(
-                    f'x-i{i}-r{r}', f't-q{q}-r{r}',
-                    -f[q] * v[i][q] / m
-                )
-        for u in U:
-            objective.offset += -f[u] * c[u]
-            for i in I:
-                objective.add_linear(f'x-i{i}-r{r}', -f[u] * v[i][u])
+    if codec is None:
+        codec = LabelCodec()
+    Q, U, I = list(Q), list(U), list(I)
+    c = np.asarray(c, dtype=float)
+    f = np.asarray(f, dtype=float)
+    # only the (candidate, query template) pairs with a benefit interact
+    v = as_benefits(v, len(c))
+    rows_i, rows_q, query_benefits, update_benefits = benefit_terms(v, Q, U, I, f)
+
+    # one replica's cost, over its t variables and then its x variables
+    replica_cost = QuadraticBlock(len(Q) + len(I), np.concatenate([-f[Q] * c[Q] / m, update_benefits]),
+                                  len(Q) + rows_i, rows_q, -query_benefits / m,
+                                  -float((f[U] * c[U]).sum()) if U else 0.0)
+    objective = replica_cost.stamp([[codec.t(q, r) for q in Q] + [codec.x(i, r) for i in I] for r in range(n_replicas)])
 
     lam_routing = (omega(Q, U, I, c, f, n_replicas) ** 3) * n_replicas + 1
 
-    routing_bqms = []
-    for q in Q:
-        constraint_model = BinaryQuadraticModel('BINARY')
-        for r in range(n_replicas):
-            constraint_model.add_linear(f't-q{q}-r{r}', 1)
-        constraint_model.offset = -m
-        hubo = square_bqm_to_binary_polynomial(constraint_model)
-        qubo = make_quadratic(hubo, 1.0, 'BINARY')
-        qubo.scale(lam_routing)
-        routing_bqms.append(qubo)
-
-    routing_combined = quicksum(routing_bqms) if routing_bqms else BinaryQuadraticModel('BINARY')
-    full_qubo = quicksum([objective, *routing_bqms, *additional_constraints])
+    routing, _ = square_linear_block(np.ones(n_replicas), -m, scale=lam_routing)
+    routing_combined = routing.stamp([[codec.t(q, r) for r in range(n_replicas)] for q in Q])
+    full_qubo = sum_bqms([objective, routing_combined, *additional_constraints])
 
     components = {
         'objective': objective,
@@ -295,7 +246,34 @@ def make_total_cost_qubo(n_replicas, Q, U, I, c, f, v, m,
     return full_qubo, components
 
 
-def make_storage_constraint(r, candidates, costs, storage_budget, calibration_bqm, queries, updates, n_replicas, baseline):
+def zero_benefit_interactions(n_replicas, Q, U, I, c, f, v, alpha=0, basis='max'):
+    """
+    How many more interactions the QUBO built from `v` would have with a
+    term for every (candidate, query template) pair, as it used to be
+    built, counted in closed form rather than by building that QUBO.
+
+    On a total cost basis a pair without a benefit would couple x_i^r and
+    t_q^r in every replica's objective. On a max cost basis it would get an
+    auxiliary variable in every load constraint, whose penalty couples it to
+    both factors and the factors to each other; the factors are already
+    coupled if both have a coefficient of their own in the constraint.
+    """
+    Q, U, I = list(Q), list(U), list(I)
+    c = np.asarray(c, dtype=float)
+    f = np.asarray(f, dtype=float)
+    rows_i, rows_q, _, update_benefits = benefit_terms(as_benefits(v, len(c)), Q, U, I, f)
+    n_zero = len(I) * len(Q) - len(rows_i)
+    if basis == 'total':
+        return n_replicas * n_zero
+    has_update = update_benefits != 0
+    has_cost = f[Q] * c[Q] != 0
+    coupled = int(has_update.sum() * has_cost.sum()) - int(np.count_nonzero(has_update[rows_i] & has_cost[rows_q]))
+    n_constraints = n_replicas + (n_replicas * (n_replicas - 1) if alpha > 0 else 0)
+    return n_constraints * (3 * n_zero - coupled)
+
+
+def make_storage_constraint(r, candidates, costs, storage_budget, calibration_bqm, queries, updates, n_replicas, baseline, I=None,
+                            codec=None):
     """
     Build a penalised storage budget constraint for replica r:
         storage_budget - sum_i w_i x_i^r - s = 0
@@ -304,51 +282,58 @@ def make_storage_constraint(r, candidates, costs, storage_budget, calibration_bq
     replica_load BQM (after lam_replica scaling) so that lam_storage sits
     in the same tier as lam_routing — both above the replica_load energy range.
 
+    The constraint is the same for every replica but for its variables, so
+    it is squared once and stamped out over each of the replicas in r.
+
     Parameters
     ----------
-    r               : replica index
+    r               : replica index, or the replica indexes to constrain
     candidates      : list of index candidates (used only for count)
     costs           : normalised storage costs per candidate
     storage_budget  : normalised storage budget (must be >= 1)
     calibration_bqm : BQM from which to derive lambda (use replica_load_combined)
+    I               : the candidates to constrain, if not all of them
+    codec           : the LabelCodec of the QUBO the constraint is added to
     """
     lam_storage = (omega(queries, updates, candidates, baseline, [1 for _ in range(len(queries) + len(updates))], n_replicas) ** 3) + 1
 
-    constraint_model = BinaryQuadraticModel(vartype='BINARY')
-    constraint_model.offset = storage_budget
-    for i, cost in enumerate(costs):
-        constraint_model.add_linear(f'x-i{i}-r{r}', -cost)
-    for var, bias in create_slack_variables(
-            f's-wmax-r{r}', max(1, int(storage_budget))).iter_linear():
-        constraint_model.add_linear(var, -bias)
-
-    max_coeff = max(
-        (abs(b) for _, b in constraint_model.iter_linear()), default=1.0
-    )
-    hubo = square_bqm_to_binary_polynomial(constraint_model)
-    qubo = make_quadratic(hubo, 2.0 * max_coeff, 'BINARY')
-    qubo.scale(lam_storage)
+    if codec is None:
+        codec = LabelCodec()
+    replicas = [r] if isinstance(r, (int, np.integer)) else list(r)
+    I = list(range(len(costs)) if I is None else I)
+
+    # the binary-encoded slack s in [0, storage_budget], as in create_slack_variables
+    n_bits = math.floor(math.log2(max(1, int(storage_budget)))) + 1
+    a = np.concatenate([-np.asarray([costs[i] for i in I], dtype=float), -2.0 ** np.arange(n_bits)])
+    max_coeff = np.abs(a).max()
+    constraint, _ = square_linear_block(a, storage_budget, strength=2.0 * max_coeff, scale=lam_storage)
+    qubo = constraint.stamp([[codec.x(i, replica) for i in I] + [codec.encode('w', r=replica, bit=k) for k in range(n_bits)]
+                             for replica in replicas])
     return qubo, lam_storage
 
 
 def anneal(qubo: BinaryQuadraticModel, algorithm='anneal', mode='simulate', num_reads=100):
     assert algorithm in ('anneal', 'qaoa'), 'algorithm must be "anneal" or "qaoa"'
     assert mode in ('simulate', 'quantum'), 'mode must be "simulate" or "quantum"'
+    # the samplers are only imported here, so the QUBO builders can be used without them
     if algorithm == 'anneal':
+        from dwave.samplers import PathIntegralAnnealingSampler, SimulatedAnnealingSampler
         if mode == 'simulate':
             sampler = SimulatedAnnealingSampler()
         elif mode == 'quantum':
             sampler = PathIntegralAnnealingSampler()
         return sampler.sample(qubo, num_reads=num_reads)
     elif algorithm == 'qaoa':
+        from qiskit_optimization import QuadraticProgram
+        from qaoa import QAOAOptimiser
         optimiser = QAOAOptimiser(qubo.num_variables, 1, num_reads, mode)
         qiskit_qubo = QuadraticProgram()
         linear_dict = {}
         quadratic_dict = {}
-        names = set()
+        # qiskit names its variables with strings, the QUBO may use integer labels
+        names = {str(var): var for var in qubo.variables}
         for vars, bias in qubo.to_qubo()[0].items():
-            names.add(vars[0])
-            names.add(vars[1])
+            vars = (str(vars[0]), str(vars[1]))
             if vars[0] == vars[1]:
                 linear_dict[vars[0]] = bias
             else:
@@ -356,4 +341,4 @@ def anneal(qubo: BinaryQuadraticModel, algorithm='anneal', mode='simulate', num_
         for name in names:
             qiskit_qubo.binary_var(name)
         qiskit_qubo.minimize(constant=qubo.offset, linear=linear_dict, quadratic=quadratic_dict)
-        return optimiser.optimise(qiskit_qubo)
+        return optimiser.optimise(qiskit_qubo).relabel_variables(names, inplace=False)
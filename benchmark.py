@@ -0,0 +1,627 @@
+import argparse
+import random
+import re
+import time
+import warnings
+from collections import defaultdict
+
+import dimod
+from dimod import BinaryQuadraticModel, make_quadratic, quicksum
+
+from anneal import SAFETY_FACTOR, create_slack_variables, make_max_cost_qubo, omega
+from benefits import as_benefits
+from index_candidate import IndexCandidate
+from labels import LabelCodec
+from parser import WorkloadParser, update_query_text
+from util import square_linear_block, sum_bqms
+
+# the TPC-H schema, so the benchmarks run without a database
+TPCH_SCHEMA = {
+    'region': ['r_regionkey', 'r_name', 'r_comment'],
+    'nation': ['n_nationkey', 'n_name', 'n_regionkey', 'n_comment'],
+    'supplier': ['s_suppkey', 's_name', 's_address', 's_nationkey', 's_phone', 's_acctbal', 's_comment'],
+    'customer': ['c_custkey', 'c_name', 'c_address', 'c_nationkey', 'c_phone', 'c_acctbal', 'c_mktsegment', 'c_comment'],
+    'part': ['p_partkey', 'p_name', 'p_mfgr', 'p_brand', 'p_type', 'p_size', 'p_container', 'p_retailprice', 'p_comment'],
+    'partsupp': ['ps_partkey', 'ps_suppkey', 'ps_availqty', 'ps_supplycost', 'ps_comment'],
+    'orders': ['o_orderkey', 'o_custkey', 'o_orderstatus', 'o_totalprice', 'o_orderdate', 'o_orderpriority', 'o_clerk',
+               'o_shippriority', 'o_comment'],
+    'lineitem': ['l_orderkey', 'l_partkey', 'l_suppkey', 'l_linenumber', 'l_quantity', 'l_extendedprice', 'l_discount', 'l_tax',
+                 'l_returnflag', 'l_linestatus', 'l_shipdate', 'l_commitdate', 'l_receiptdate', 'l_shipinstruct', 'l_shipmode',
+                 'l_comment'],
+}
+
+def synthetic_query(rng):
+    '''
+    A random TPC-H style query over one to three tables, with comparison,
+    `between` and `like` predicates, sometimes a correlated subquery, and a
+    `group by`/`order by` tail.
+    '''
+    tables = rng.sample(sorted(TPCH_SCHEMA), rng.randint(1, 3))
+    columns = [column for table in tables for column in TPCH_SCHEMA[table]]
+    predicates = []
+    for column in rng.sample(columns, min(len(columns), rng.randint(1, 4))):
+        kind = rng.randrange(3)
+        if kind == 0:
+            predicates.append(f'{column} <= {rng.randint(1, 10000)}')
+        elif kind == 1:
+            predicates.append(f"{column} between date '1995-01-01' and date '1995-12-31'")
+        else:
+            predicates.append(f"{column} like '%{rng.choice(columns)}%'")
+    if rng.random() < 0.3:
+        inner = rng.choice(sorted(TPCH_SCHEMA))
+        inner_column = rng.choice(TPCH_SCHEMA[inner])
+        predicates.append(f'{rng.choice(columns)} in (select {inner_column} from {inner} where {rng.choice(TPCH_SCHEMA[inner])} > 10)')
+    selected = ', '.join(rng.sample(columns, min(len(columns), 3)))
+    grouped = rng.choice(columns)
+    return (f'select {selected}, count(*) from {", ".join(tables)} where {" and ".join(predicates)} '
+            f'group by {grouped} order by {grouped};')
+
+def synthetic_parser(n_templates, schema_width=1, seed=0):
+    '''
+    A parser over `n_templates` synthetic queries. With `schema_width` > 1
+    the schema also holds that many renamed copies of every TPC-H table
+    (`lineitem_2`, with columns such as `l_orderkey_2`) that the queries
+    never read, as in a wide production schema.
+    '''
+    parser = WorkloadParser(None)
+    rng = random.Random(seed)
+    parser.workload = [synthetic_query(rng) for _ in range(n_templates)]
+    parser.templates = list(range(n_templates))
+    parser.n_templates = n_templates
+    for copy in range(1, schema_width + 1):
+        suffix = f'_{copy}' if copy > 1 else ''
+        for table, columns in TPCH_SCHEMA.items():
+            parser.columns += [column + suffix for column in columns]
+            parser.table_of_columns += [table + suffix] * len(columns)
+    return parser
+
+def legacy_extract_candidates(parser):
+    '''
+    The regex and substring-scan candidate extraction that
+    `WorkloadParser.extract_candidates` replaced.
+    '''
+    REGEX = 'WHERE (.+?)(?:\\)|group by|order by|;)'
+    found_candidates = set()
+
+    last_template = -1
+    for i_t, template in enumerate(parser.templates):
+        if template == last_template: continue
+        last_template = template
+
+        query = parser.workload[i_t]
+        predicates = re.findall(REGEX, query, re.IGNORECASE)
+
+        for predicate in predicates:
+            for column in parser.columns:
+                if column in predicate:
+                    found_candidates.add(column)
+
+    candidates = []
+    for column in found_candidates:
+        index = parser.columns.index(column)
+        candidates.append(IndexCandidate(column, parser.table_of_columns[index]))
+    return candidates
+
+# TPC-H queries with subqueries in FROM, as generated by qgen
+TPCH_SUBQUERY_QUERIES = [
+    """select c_count, count(*) as custdist from ( select c_custkey, count(o_orderkey) from customer left outer join orders on
+    c_custkey = o_custkey and o_comment not like '%special%requests%' group by c_custkey ) as c_orders (c_custkey, c_count)
+    group by c_count order by custdist desc, c_count desc;\nlimit -1;""",
+    """select supp_nation, cust_nation, l_year, sum(volume) as revenue from ( select n1.n_name as supp_nation, n2.n_name as
+    cust_nation, extract(year from l_shipdate) as l_year, l_extendedprice * (1 - l_discount) as volume from supplier, lineitem,
+    orders, customer, nation n1, nation n2 where s_suppkey = l_suppkey and o_orderkey = l_orderkey and c_custkey = o_custkey and
+    s_nationkey = n1.n_nationkey and c_nationkey = n2.n_nationkey and ( (n1.n_name = 'FRANCE' and n2.n_name = 'GERMANY') or
+    (n1.n_name = 'GERMANY' and n2.n_name = 'FRANCE') ) and l_shipdate between date '1995-01-01' and date '1996-12-31' ) as
+    shipping group by supp_nation, cust_nation, l_year order by supp_nation, cust_nation, l_year;\nlimit -1;""",
+    """select cntrycode, count(*) as numcust, sum(c_acctbal) as totacctbal from ( select substring(c_phone from 1 for 2) as
+    cntrycode, c_acctbal from customer where substring(c_phone from 1 for 2) in ('13', '31', '23', '29', '30', '18', '17') and
+    c_acctbal > ( select avg(c_acctbal) from customer where c_acctbal > 0.00 and substring(c_phone from 1 for 2) in ('13', '31',
+    '23', '29', '30', '18', '17') ) and not exists ( select * from orders where o_custkey = c_custkey ) ) as custsale group by
+    cntrycode order by cntrycode;\nlimit -1;""",
+    """select l_shipmode, sum(l_quantity) from lineitem where l_shipdate <= date '1998-12-01' - interval '90' day (3) and
+    l_receiptdate >= date '1994-01-01' and l_receiptdate < date '1994-01-01' + 90 days) group by l_shipmode;\nlimit 100;""",
+]
+
+def synthetic_subquery_query(rng, n_subqueries):
+    '''
+    A long TPC-DS style query with `n_subqueries` nested and sibling
+    subqueries in FROM, with and without aliases, date arithmetic in days
+    and `limit -1` tails.
+    '''
+    def subquery(budget):
+        if budget <= 1:
+            inner = rng.choice(sorted(TPCH_SCHEMA))
+            body = f'select * from {inner} where {rng.choice(TPCH_SCHEMA[inner])} < {rng.randint(1, 100)} days)'
+        else:
+            split = rng.randint(1, budget - 1)
+            body = f'select * from {subquery(split)}, {subquery(budget - split)} where x = 1'
+        follower = rng.choice(['', ' t', ' as t', ' where y = 2', ' group by z', ' order by z', ' limit 5'])
+        return f'({body}){follower}'
+    parts = []
+    while n_subqueries > 0:
+        size = min(n_subqueries, rng.randint(1, 20))
+        n_subqueries -= size
+        parts.append(f'select count(*) from {subquery(size)};\nlimit -1;')
+    return '\n'.join(parts)
+
+def legacy_add_alias_subquery(query_text):
+    '''
+    The subquery alias insertion that `add_alias_subquery` replaced, which
+    rescans the parentheses from every subquery and copies the query for
+    every alias it inserts.
+    '''
+    text = query_text.lower()
+    positions = []
+    for match in re.finditer(r"((from)|,)[ \n]*\(", text):
+        counter = 1
+        pos = match.span()[1]
+        while counter > 0:
+            char = text[pos]
+            if char == "(":
+                counter += 1
+            elif char == ")":
+                counter -= 1
+            pos += 1
+        next_word = query_text[pos:].lstrip().split(" ")[0].split("\n")[0]
+        if next_word[0] in [")", ","] or next_word in [
+            "limit",
+            "group",
+            "order",
+            "where",
+        ]:
+            positions.append(pos)
+    for pos in sorted(positions, reverse=True):
+        query_text = query_text[:pos] + " as alias123 " + query_text[pos:]
+    return query_text
+
+def legacy_update_query_text(text):
+    text = text.replace(";\nlimit ", " limit ").replace("limit -1", "")
+    text = re.sub(r" ([0-9]+) days\)", r" interval '\1 days')", text)
+    return legacy_add_alias_subquery(text)
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def synthetic_problem(n_templates, n_candidates, seed=0):
+    '''
+    Random per-execution baselines, frequencies and benefits, where most
+    candidates help a few templates and slow the update templates down.
+    '''
+    rng = random.Random(seed)
+    updates = list(range(n_templates - max(1, n_templates // 10), n_templates))
+    baseline = [rng.randint(100, 10000) for _ in range(n_templates)]
+    frequencies = [rng.randint(1, 5) for _ in range(n_templates)]
+    benefits = [[(-rng.randint(0, 50) if t in updates else rng.choice([0, 0, 0, rng.randint(1, baseline[t])]))
+                 for t in range(n_templates)] for _ in range(n_candidates)]
+    queries = [t for t in range(n_templates) if t not in updates]
+    return queries, updates, baseline, frequencies, benefits
+
+def bench_extraction(args):
+    '''
+    Candidate extraction time and candidate count against the number of
+    templates and the width of the schema, for the legacy and the
+    tokenizer-based extraction. Legacy candidates that are not on a table
+    the query reads, or whose column only occurs inside another name, are
+    counted as false positives.
+    '''
+    print(f'{"templates":>10} {"columns":>8} {"legacy (s)":>11} {"tokenizer (s)":>14} {"legacy candidates":>18} '
+          f'{"false positives":>16} {"candidates":>11}')
+    for width in args.schema_widths:
+        for size in args.sizes:
+            parser = synthetic_parser(size, width)
+            legacy, legacy_time = timed(legacy_extract_candidates, parser)
+            _, tokenizer_time = timed(parser.extract_candidates)
+            found = {(candidate.table, candidate.column) for candidate in parser.get_candidates()}
+            false_positives = sum(1 for candidate in legacy if (candidate.table, candidate.column) not in found)
+            print(f'{size:>10} {len(parser.columns):>8} {legacy_time:>11.4f} {tokenizer_time:>14.4f} {len(legacy):>18} '
+                  f'{false_positives:>16} {len(found):>11}')
+
+def bench_rewrite(args):
+    '''
+    Query rewriting time against the number of subqueries in a query, for
+    the legacy and the single-scan `update_query_text`. test_parser.py
+    checks that both produce identical output.
+    '''
+    print(f'{"subqueries":>10} {"characters":>11} {"legacy (s)":>11} {"single scan (s)":>16}')
+    for size in args.sizes:
+        query = synthetic_subquery_query(random.Random(size), size)
+        _, legacy_time = timed(legacy_update_query_text, query)
+        _, rewrite_time = timed(update_query_text, query)
+        print(f'{size:>10} {len(query):>11} {legacy_time:>11.4f} {rewrite_time:>16.4f}')
+
+def square_bqm_to_binary_polynomial(bqm: dimod.BinaryQuadraticModel):
+    """
+    Square a dimod BinaryQuadraticModel and return a dimod.BinaryPolynomial.
+    Higher-order terms are preserved.
+    """
+
+    if bqm.vartype is not dimod.BINARY:
+        raise ValueError("BQM must have vartype=BINARY")
+
+    # Collect polynomial terms: monomial -> coefficient
+    poly = defaultdict(float)
+
+    # constant term
+    if bqm.offset != 0.0:
+        poly[()] += bqm.offset
+
+    # linear terms
+    for v, bias in bqm.linear.items():
+        poly[(v,)] += bias
+
+    # quadratic terms
+    for (u, v), bias in bqm.quadratic.items():
+        poly[tuple(sorted((u, v)))] += bias
+
+    # ---- square the polynomial ----
+    result = defaultdict(float)
+    terms = list(poly.items())
+    n = len(terms)
+
+    def multiply_terms(t1, t2):
+        # binary variables: x^2 = x
+        return tuple(sorted(set(t1) | set(t2)))
+
+    # diagonal terms
+    for term, coeff in terms:
+        result[term] += coeff * coeff
+
+    # cross terms (2ab)
+    for i in range(n):
+        t1, c1 = terms[i]
+        if c1 == 0: continue
+        for j in range(i + 1, n):
+            t2, c2 = terms[j]
+            if c2 == 0: continue
+            new_term = multiply_terms(t1, t2)
+            result[new_term] += 2 * c1 * c2
+
+    # ---- build BinaryPolynomial ----
+    # NOTE: constant term is stored under key ()
+    bp = dimod.BinaryPolynomial(dict(result), vartype=dimod.BINARY)
+
+    return bp
+
+def legacy_make_max_cost_qubo(Z_max, n_replicas, Q, U, I, c, f, v, m, alpha,
+                       additional_constraints=None):
+    """
+    Build a QUBO for the divergent design tuning problem on a maximum cost
+    basis, term by term and with named variables, as `make_max_cost_qubo`
+    did before it was built from coefficient arrays. The two have the same
+    energy whenever every auxiliary variable equals its product.
+
+    Lambda calibration strategy
+    ---------------------------
+    All penalty lambdas are derived from the assembled objective BQM's
+    coefficient structure AFTER it is built, not from the raw problem
+    parameters. This ensures correct scaling regardless of normalisation.
+
+    lam_replica  : enforces z^(0) >= load_r for each replica r.
+                   Multiplier=2 allows near-optimal feasible solutions to
+                   remain distinguishable while enforcing feasibility.
+
+    lam_routing  : hard constraint enforcing sum_r t_q^r = m.
+                   Multiplier scales with n_replicas * |Q| so it dominates
+                   the replica-load terms regardless of problem size.
+                   This is the constraint that must never be violated.
+    """
+    assert alpha <= 1, 'the convex combination over all probabilities must total 1'
+    # Sanity check: Z_max should be achievable by a single replica
+    max_single_replica_load = sum(f[q] * c[q] / m for q in Q)
+    if Z_max > max_single_replica_load * 2:
+        import warnings
+        warnings.warn(
+            f'Z_max={Z_max} is more than 2x the maximum possible single-replica '
+            f'load ({max_single_replica_load:.0f}). This inflates slack variable '
+            f'coefficients and worsens the energy landscape. Consider tightening Z_max.'
+        )
+    if additional_constraints is None:
+        additional_constraints = []
+    # only the (candidate, query template) pairs with a benefit interact
+    v = as_benefits(v, len(c))
+    in_queries = set(Q)
+
+    # Build the objective BQM: min z^(0) = sum_k 2^k z_k
+    objective = create_slack_variables('z', Z_max)
+
+    # build the failure terms z^(j)
+    subobjectives = []
+    if alpha > 0:
+        for r in range(n_replicas):
+            subobjective = create_slack_variables(f'z^({r})', Z_max)
+            subobjectives.append(subobjective)
+
+    # lam_replica: must dominate the objective range.
+    lam_replica = omega(Q, U, I, c, f, n_replicas) * SAFETY_FACTOR
+
+    replica_load_bqms = []
+    routing_bqms = []
+
+    # Per-replica load constraints.
+    # Encodes: z^(0) - sum_q qcost(q, I_r) - sum_u ucost(u, I_r) - s^(r) = 0
+    for r in range(n_replicas):
+        constraint_model = BinaryQuadraticModel('BINARY')
+
+        # z^(0) terms
+        for var, bias in objective.iter_linear():
+            constraint_model.add_linear(var, bias)
+
+        # Query cost: -f(q)/m * c_q * t_q^r  and  -f(q)/m * v_i^q * x_i^r * t_q^r
+        for q in Q:
+            constraint_model.add_linear(f't-q{q}-r{r}', -f[q] * c[q] / m)
+        for i in I:
+            constraint_model.add_variable(f'x-i{i}-r{r}')
+            for q, benefit in v[i].items():
+                if q in in_queries:
+                    constraint_model.add_quadratic(
+                        f'x-i{i}-r{r}', f't-q{q}-r{r}',
+                        f[q] * benefit / m
+                    )
+
+        # Update cost: constant offset and -f(u)*v_i^u * x_i^r linear terms
+        for u in U:
+            constraint_model.offset += -f[u] * c[u]
+            for i in I:
+                constraint_model.add_linear(f'x-i{i}-r{r}', -f[u] * v[i][u])
+
+        # Slack s^(r) in [0, Z_max] absorbs z^(0) - load_r
+        for var, bias in create_slack_variables(f's-r{r}', Z_max).iter_linear():
+            constraint_model.add_linear(var, -bias)
+
+        # The make_quadratic reduction strength must exceed the largest
+        # coefficient in the expression being squared.
+        max_coeff = max(
+            (abs(b) for _, b in constraint_model.iter_linear()), default=1.0
+        )
+        hubo = square_bqm_to_binary_polynomial(constraint_model)
+        qubo = make_quadratic(hubo, 2.0 * max_coeff, 'BINARY')
+        qubo.scale(lam_replica)
+        replica_load_bqms.append(qubo)
+
+    # lam_routing must dominate the replica_load terms, not just the objective.
+    # The replica_load BQMs are already scaled by lam_replica and involve
+    # O(|I|*|Q|) variables whose squared interactions can be enormous.
+    # Deriving lam_routing from the assembled replica_load BQM ensures it
+    # genuinely outweighs whatever energy the annealer gains by violating routing.
+    replica_load_combined = quicksum(replica_load_bqms) if replica_load_bqms else BinaryQuadraticModel('BINARY')
+    lam_routing = (omega(Q, U, I, c, f, n_replicas) ** 3) + 1 * SAFETY_FACTOR
+
+    # failure-aware replica load terms
+    failure_bqms = []
+    failure_routing_bqms = []
+    if alpha > 0:
+        for j in range(n_replicas):
+            for r in range(n_replicas):
+                if j == r: continue
+
+                constraint_model = BinaryQuadraticModel('BINARY')
+                # z^(j) terms
+                for var, bias in subobjectives[j].iter_linear():
+                    constraint_model.add_linear(var, bias)
+                
+                # Query cost: -f(q)/min{m, |R|-1} * c_q * t_q^(r,j)  and  -f(q)/min{m, |R|-1} * v_i^q * x_i^r * t_q^(r,j)
+                for q in Q:
+                    constraint_model.add_linear(f't-q{q}-r{r}-j{j}', -f[q] * c[q] / min(m, n_replicas - 1))
+                for i in I:
+                    constraint_model.add_variable(f'x-i{i}-r{r}')
+                    for q, benefit in v[i].items():
+                        if q in in_queries:
+                            constraint_model.add_quadratic(
+                                f'x-i{i}-r{r}', f't-q{q}-r{r}-j{j}',
+                                f[q] * benefit / min(m, n_replicas - 1)
+                            )
+
+                # Update cost: constant offset and -f(u)*v_i^u * x_i^r linear terms
+                for u in U:
+                    constraint_model.offset += -f[u] * c[u]
+                    for i in I:
+                        constraint_model.add_linear(f'x-i{i}-r{r}', -f[u] * v[i][u])
+
+                # Slack s^(r) in [0, Z_max] absorbs z^(0) - load_r
+                for var, bias in create_slack_variables(f's-j{j}-r{r}', Z_max).iter_linear():
+                    constraint_model.add_linear(var, -bias)
+
+                # The make_quadratic reduction strength must exceed the largest
+                # coefficient in the expression being squared.
+                max_coeff = max(
+                    (abs(b) for _, b in constraint_model.iter_linear()), default=1.0
+                )
+                hubo = square_bqm_to_binary_polynomial(constraint_model)
+                qubo = make_quadratic(hubo, 2.0 * max_coeff, 'BINARY')
+                qubo.scale(lam_replica)
+                failure_bqms.append(qubo)
+        
+        # failure routing constraints
+        for q in Q:
+            for j in range(n_replicas):
+                constraint_model = BinaryQuadraticModel('BINARY')
+                for r in range(n_replicas):
+                    if j == r: continue
+                    constraint_model.add_linear(f't-q{q}-r{r}-j{j}', 1)
+                constraint_model.offset = -min(m, n_replicas - 1)
+                hubo = square_bqm_to_binary_polynomial(constraint_model)
+                qubo = make_quadratic(hubo, 1.0, 'BINARY')
+                qubo.scale(lam_routing)
+                failure_routing_bqms.append(qubo)
+
+    # Hard routing constraint: lambda_routing * (sum_r t_q^r - m)^2
+    for q in Q:
+        constraint_model = BinaryQuadraticModel('BINARY')
+        for r in range(n_replicas):
+            constraint_model.add_linear(f't-q{q}-r{r}', 1)
+        constraint_model.offset = -m
+        hubo = square_bqm_to_binary_polynomial(constraint_model)
+        qubo = make_quadratic(hubo, 1.0, 'BINARY')
+        qubo.scale(lam_routing)
+        routing_bqms.append(qubo)
+
+    # Merge routing BQMs into one for decomposition reporting
+    routing_combined = quicksum(routing_bqms) if routing_bqms else BinaryQuadraticModel('BINARY')
+
+    # scale the objective according to the failure probability
+    objective.scale(1 - alpha)
+    for subobjective in subobjectives:
+        subobjective.scale(alpha / n_replicas)
+
+    full_qubo = quicksum([objective, *subobjectives, *replica_load_bqms, *routing_bqms, *failure_bqms, *failure_routing_bqms, *additional_constraints])
+
+    components = {
+        'replica_load': replica_load_combined,
+        'routing':      routing_combined,
+        'lam_replica':  lam_replica,
+        'lam_routing':  lam_routing,
+    }
+    if additional_constraints:
+        components['storage'] = quicksum(additional_constraints)
+
+    return full_qubo, components
+
+def build_max_cost_qubo(builder, n_replicas, Q, U, c, f, v, alpha):
+    '''
+    The max cost QUBO of a problem without a storage constraint, with one
+    candidate per row of `v`. The array-based QUBO is labelled by a
+    LabelCodec, so it is relabelled to the names the term-by-term builder
+    uses.
+    '''
+    Z_max = max(1, omega(Q, U, range(len(v)), c, f, n_replicas))
+    if builder is legacy_make_max_cost_qubo:
+        return builder(Z_max, n_replicas, Q, U, list(range(len(v))), c, f, v, 1, alpha)[0]
+    codec = LabelCodec()
+    qubo = builder(Z_max, n_replicas, Q, U, list(range(len(v))), c, f, v, 1, alpha, codec=codec)[0]
+    return qubo.relabel_variables(codec.names(), inplace=False)
+
+def bench_qubo(args):
+    '''
+    Max cost QUBO construction time against the number of templates (with
+    twice as many candidates), for the term-by-term and the array-based
+    builder. test_qubo.py checks that both give the same energies.
+    '''
+    # the synthetic update templates make Z_max loose, which is warned about
+    warnings.simplefilter('ignore', UserWarning)
+    print(f'{"templates":>10} {"candidates":>11} {"variables":>10} {"legacy (s)":>11} {"numpy (s)":>10}')
+    for size in args.sizes:
+        queries, updates, baseline, frequencies, benefits = synthetic_problem(size, 2 * size, size)
+        _, legacy_time = timed(build_max_cost_qubo, legacy_make_max_cost_qubo, args.replicas, queries, updates, baseline, frequencies,
+                               benefits, 0)
+        vectorised, numpy_time = timed(build_max_cost_qubo, make_max_cost_qubo, args.replicas, queries, updates, baseline,
+                                       frequencies, benefits, 0)
+        print(f'{size:>10} {2 * size:>11} {vectorised.num_variables:>10} {legacy_time:>11.4f} {numpy_time:>10.4f}')
+
+def load_constraint(n_templates, n_candidates, seed=0):
+    '''
+    A replica load constraint as the max cost QUBO builds it: slack bits,
+    routing and index variables, and index x routing products for a third
+    of the (candidate, template) pairs.
+    '''
+    rng = random.Random(seed)
+    bqm = BinaryQuadraticModel('BINARY')
+    for k in range(16):
+        bqm.add_linear(f'z-{k}', 2 ** k)
+        bqm.add_linear(f's-r0-{k}', -2 ** k)
+    for q in range(n_templates):
+        bqm.add_linear(f't-q{q}-r0', -rng.randint(100, 10000))
+        for i in range(n_candidates):
+            if rng.random() < 1 / 3:
+                bqm.add_quadratic(f'x-i{i}-r0', f't-q{q}-r0', rng.randint(1, 1000))
+    bqm.offset = -rng.randint(0, 1000)
+    return bqm
+
+def legacy_square(bqm, strength):
+    '''
+    Squaring and quadratising a constraint through a binary polynomial and
+    make_quadratic, as the max cost QUBO used to.
+    '''
+    return make_quadratic(square_bqm_to_binary_polynomial(bqm), strength, 'BINARY')
+
+def square_constraint(bqm, strength):
+    '''
+    Squaring and quadratising a constraint given as a BQM, whose quadratic
+    terms are the products to replace, in closed form with
+    square_linear_block, as the max cost QUBO builds its load constraints.
+    Each product's auxiliary variable is named `u*v`, as make_quadratic
+    names it.
+    '''
+    labels = list(bqm.variables)
+    position = {label: k for k, label in enumerate(labels)}
+    # as in make_quadratic, a product with a zero coefficient gets no auxiliary variable
+    quadratic = [(pair, bias) for pair, bias in bqm.quadratic.items() if bias != 0]
+    square, penalty = square_linear_block([bqm.get_linear(v) for v in labels], bqm.offset,
+                                          [(position[u], position[v]) for (u, v), _ in quadratic],
+                                          [bias for _, bias in quadratic], strength)
+    label_set = [labels + ['*'.join(sorted((str(u), str(v)))) for (u, v), _ in quadratic]]
+    return sum_bqms([square.stamp(label_set), penalty.stamp(label_set)])
+
+def bench_square(args):
+    '''
+    Squaring and quadratising one replica load constraint against the number
+    of templates (with twice as many candidates), through a binary
+    polynomial and make_quadratic, and in closed form. test_qubo.py checks
+    that both give the same energies.
+    '''
+    print(f'{"templates":>10} {"candidates":>11} {"terms":>6} {"polynomial (s)":>15} {"closed form (s)":>16} {"auxiliaries":>12}')
+    for size in args.sizes:
+        constraint = load_constraint(size, 2 * size, size)
+        strength = 2.0 * max(abs(bias) for _, bias in constraint.iter_linear())
+        _, legacy_time = timed(legacy_square, constraint, strength)
+        closed, closed_time = timed(square_constraint, constraint, strength)
+        n_aux = sum(1 for variable in closed.variables if '*' in str(variable))
+        print(f'{size:>10} {2 * size:>11} {constraint.num_variables + constraint.num_interactions:>6} {legacy_time:>15.4f} '
+              f'{closed_time:>16.4f} {n_aux:>12}')
+
+def bench_replicas(args):
+    '''
+    Max cost QUBO construction time against the number of replicas, for one
+    synthetic problem of `--templates` templates (with twice as many
+    candidates), without and with failures. The load constraint of every
+    replica and every failure is stamped out from one canonical block, so
+    the time per interaction stays flat as replicas are added.
+    '''
+    warnings.simplefilter('ignore', UserWarning)
+    queries, updates, baseline, frequencies, benefits = synthetic_problem(args.templates, 2 * args.templates, args.templates)
+    candidates = list(range(len(benefits)))
+    print(f'{"replicas":>9} {"alpha":>6} {"variables":>10} {"interactions":>13} {"build (s)":>10} {"per interaction (us)":>21}')
+    for size in args.sizes:
+        Z_max = max(1, omega(queries, updates, candidates, baseline, frequencies, size))
+        for alpha in (0, 0.5):
+            (qubo, _), build_time = timed(make_max_cost_qubo, Z_max, size, queries, updates, candidates, baseline, frequencies,
+                                          benefits, 1, alpha)
+            print(f'{size:>9} {alpha:>6} {qubo.num_variables:>10} {qubo.num_interactions:>13} {build_time:>10.4f} '
+                  f'{1e6 * build_time / max(1, qubo.num_interactions):>21.3f}')
+
+BENCHMARKS = {
+    'extraction': bench_extraction,
+    'rewrite': bench_rewrite,
+    'qubo': bench_qubo,
+    'square': bench_square,
+    'replicas': bench_replicas,
+}
+
+# workload sizes each benchmark runs at unless given
+DEFAULT_SIZES = {
+    'extraction': [10, 100, 1000, 10000],
+    'rewrite': [10, 100, 1000, 10000],
+    'qubo': [5, 10, 20],
+    'square': [5, 10, 20, 40],
+    'replicas': [2, 4, 8],
+}
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description='micro-benchmarks for the workload parser and QUBO builders')
+    parser.add_argument('benchmark', choices=BENCHMARKS.keys())
+    parser.add_argument('-s', '--sizes', type=int, nargs='+',
+                        help='workload sizes (replica counts for the replicas benchmark) to run the benchmark at')
+    parser.add_argument('-w', '--schema-widths', type=int, nargs='+', default=[1, 10],
+                        help='copies of the TPC-H schema in the catalog, for the extraction benchmark')
+    parser.add_argument('-r', '--replicas', type=int, default=2,
+                        help='number of replicas, for the QUBO benchmarks')
+    parser.add_argument('-t', '--templates', type=int, default=20,
+                        help='number of templates, for the replicas benchmark')
+    args = parser.parse_args()
+    args.sizes = args.sizes or DEFAULT_SIZES[args.benchmark]
+    return args
+
+if __name__ == '__main__':
+    args = get_arguments()
+    BENCHMARKS[args.benchmark](args)
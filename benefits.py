@@ -0,0 +1,131 @@
+import numpy as np
+
+class BenefitRow:
+    '''
+    The benefits of one candidate, read like a list of per-template
+    benefits: templates it does not benefit read as 0.
+    '''
+
+    def __init__(self, templates, values, n_templates):
+        self.values = dict(zip(templates.tolist(), values.tolist()))
+        self.n_templates = n_templates
+
+    def __getitem__(self, template):
+        return self.values.get(template, 0)
+
+    def __len__(self):
+        return self.n_templates
+
+    def __iter__(self):
+        return (self.values.get(template, 0) for template in range(self.n_templates))
+
+    def items(self):
+        '''
+        :returns: the (template, benefit) pairs that are stored
+        '''
+        return self.values.items()
+
+class BenefitMatrix:
+    '''
+    The benefit of every index candidate for every template, in compressed
+    sparse row form. Most candidates only change the cost of a few
+    templates, so only the (candidate, template) pairs with a benefit are
+    stored, and the QUBO builders only emit terms for those. It still reads
+    like the list of per-template benefit lists it replaces, matrix[i][t].
+    '''
+
+    def __init__(self, n_templates, indptr, indices, data):
+        self.n_templates = n_templates
+        # the entries of row i are indices[indptr[i]:indptr[i + 1]] and data[indptr[i]:indptr[i + 1]]
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = np.asarray(data)
+        self._rows = {}
+
+    @classmethod
+    def from_rows(cls, rows, n_templates=None, keep_zeros=False):
+        '''
+        :param rows: the per-template benefits of every candidate, as lists or {template: benefit} dicts
+        :param n_templates: the number of templates, if any row is a dict
+        :param keep_zeros: store the zero benefits too
+        '''
+        rows = [row if isinstance(row, dict) else dict(enumerate(row)) for row in rows]
+        if n_templates is None:
+            n_templates = max((max(row, default=-1) + 1 for row in rows), default=0)
+        indptr, indices, data = [0], [], []
+        for row in rows:
+            for template in sorted(row):
+                if keep_zeros or row[template] != 0:
+                    indices.append(template)
+                    data.append(row[template])
+            indptr.append(len(indices))
+        return cls(n_templates, indptr, indices, np.array(data) if data else np.zeros(0))
+
+    @property
+    def shape(self) -> tuple:
+        return len(self), self.n_templates
+
+    @property
+    def nnz(self) -> int:
+        return len(self.indices)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __getitem__(self, i) -> BenefitRow:
+        if i not in self._rows:
+            start, end = self.indptr[i], self.indptr[i + 1]
+            self._rows[i] = BenefitRow(self.indices[start:end], self.data[start:end], self.n_templates)
+        return self._rows[i]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    def coo(self) -> tuple:
+        '''
+        :returns: the candidate, template and benefit of every stored entry, as arrays
+        '''
+        return np.repeat(np.arange(len(self)), np.diff(self.indptr)), self.indices, self.data
+
+    def map(self, fn):
+        '''
+        :param fn: a vectorised function of the stored benefits
+        :returns: the matrix of fn(benefit), without the entries that become 0
+        '''
+        rows, templates, data = self.coo()
+        data = np.asarray(fn(data))
+        keep = data != 0
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows[keep], minlength=len(self)))])
+        return BenefitMatrix(self.n_templates, indptr, templates[keep], data[keep])
+
+    def scale_templates(self, factors):
+        '''
+        :param factors: what the benefits for every template are multiplied by
+        '''
+        factors = np.asarray(factors, dtype=float)
+        return self.map(lambda data: data * factors[self.indices])
+
+    def densified(self):
+        '''
+        :returns: the same matrix with every (candidate, template) pair stored,
+                  which is what the QUBO builders emitted terms for before
+        '''
+        return BenefitMatrix.from_rows(self.tolist(), self.n_templates, keep_zeros=True)
+
+    def toarray(self) -> np.ndarray:
+        dense = np.zeros(self.shape, dtype=self.data.dtype if self.nnz else float)
+        rows, templates, data = self.coo()
+        dense[rows, templates] = data
+        return dense
+
+    def tolist(self) -> list:
+        return [list(row) for row in self]
+
+def as_benefits(v, n_templates=None) -> BenefitMatrix:
+    '''
+    :param v: a BenefitMatrix or the per-template benefits of every candidate as lists
+    '''
+    return v if isinstance(v, BenefitMatrix) else BenefitMatrix.from_rows(v, n_templates)
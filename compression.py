@@ -0,0 +1,110 @@
+from dataclasses import dataclass, field
+
+from dimod import SampleSet
+
+from benefits import BenefitMatrix, as_benefits
+
+@dataclass
+class TemplateClustering:
+    '''
+    A workload compressed by merging query templates with near-identical
+    costs into weighted super-templates. Each super-template takes the
+    template id of its first member, its leader, so the compressed QUBO's
+    variables are a subset of the full one's, and its frequency is the sum
+    of its members'. Its per-execution baseline and benefits are the
+    frequency-weighted means of theirs, which keeps the cost of any
+    configuration in which the members share their routing exact.
+    '''
+    # {leader: the templates it stands for, itself included}
+    clusters: dict
+    # the compressed Q, c, f and v for the QUBO builders
+    queries: list
+    baseline: list
+    frequencies: list
+    benefits: BenefitMatrix
+    # most the optimal total cost can grow by, from routing members together
+    total_bound: float = 0.0
+    # most the optimal maximum replica cost can grow by, as a cluster cannot
+    # be split between replicas
+    max_bound: float = 0.0
+    workload_cost: float = field(default=0.0, repr=False)
+
+    def report(self) -> str:
+        n_templates = sum(len(members) for members in self.clusters.values())
+        scale = 100 / self.workload_cost if self.workload_cost else 0.0
+        return (f'- clustered {n_templates} query templates into {len(self.clusters)} super-templates, '
+                f'error bound {self.total_bound:.6g} ({scale * self.total_bound:.2f}% of the workload cost) on a total cost basis, '
+                f'{self.max_bound:.6g} ({scale * self.max_bound:.2f}%) on a max cost basis')
+
+    def expand_sample(self, sample, codec) -> dict:
+        '''
+        Route every template the way the compressed sample routes its
+        super-template.
+        '''
+        expanded = dict(sample)
+        for label, value in sample.items():
+            key = codec.decode(label)
+            if key.kind != 't' or key.q not in self.clusters:
+                continue
+            for member in self.clusters[key.q]:
+                expanded[codec.t(member, key.r, key.j)] = value
+        return expanded
+
+    def expand(self, reads: SampleSet, codec) -> SampleSet:
+        '''
+        :param reads: the samples of the compressed QUBO
+        :param codec: the LabelCodec the QUBO was labelled with
+        :returns: the same samples with every template routed
+        '''
+        samples = [self.expand_sample(sample, codec) for sample in reads.samples()]
+        return SampleSet.from_samples(samples, 'BINARY', reads.record.energy, num_occurrences=reads.record.num_occurrences)
+
+def template_distance(a, b, c, v) -> float:
+    return max([abs(c[a] - c[b])] + [abs(row[a] - row[b]) for row in v])
+
+def cluster_templates(Q, c, f, v, tolerance: float) -> TemplateClustering:
+    '''
+    Greedily cluster the query templates: each template joins the first
+    cluster whose leader's baseline and benefits are all within `tolerance`
+    (relative to the larger baseline) of its own, and otherwise leads a
+    new cluster. Update templates are not routed, so they are left alone.
+
+    :param Q: the query templates
+    :param c: the per-execution baseline of every template
+    :param f: the frequency of every template
+    :param v: the per-execution benefit of every candidate on every template
+    :param tolerance: how far apart two templates in a cluster may be
+    :returns: the clustering, with the compressed inputs for the QUBO
+    '''
+    v = as_benefits(v, len(c))
+    clusters = {}
+    for q in Q:
+        for leader, members in clusters.items():
+            if template_distance(q, leader, c, v) <= tolerance * max(abs(c[q]), abs(c[leader])):
+                members.append(q)
+                break
+        else:
+            clusters[q] = [q]
+
+    baseline = list(c)
+    frequencies = list(f)
+    rows = [dict(row.items()) for row in v]
+    total_bound = 0.0
+    max_bound = 0.0
+    for leader, members in clusters.items():
+        weight = sum(f[q] for q in members)
+        frequencies[leader] = weight
+        if weight == 0:
+            continue
+        baseline[leader] = sum(f[q] * c[q] for q in members) / weight
+        for i, row in enumerate(v):
+            rows[i][leader] = sum(f[q] * row[q] for q in members) / weight
+            if rows[i][leader] == 0:
+                del rows[i][leader]
+        # every member may end up on a replica that suits the cluster but not itself ...
+        total_bound += sum(f[q] * sum(abs(row[q] - rows[i].get(leader, 0)) for i, row in enumerate(v)) for q in members)
+        # ... and may have to follow the cluster onto the busiest replica
+        costs = [f[q] * c[q] for q in members]
+        max_bound += sum(costs) - max(costs)
+    return TemplateClustering(clusters, list(clusters), baseline, frequencies, BenefitMatrix.from_rows(rows, v.n_templates),
+                              total_bound, max_bound, sum(f[q] * c[q] for q in Q))
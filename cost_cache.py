@@ -0,0 +1,130 @@
+import hashlib
+import json
+import sqlite3
+import threading
+
+# Table sizes and column statistics, which with the planner settings below are
+# anything that can change a plan estimate.
+FINGERPRINT_QUERY = '''
+SELECT c.relname, c.reltuples, c.relpages, s.attname, s.null_frac, s.avg_width, s.n_distinct, s.correlation
+FROM pg_class c
+LEFT JOIN pg_stats s ON s.schemaname = 'public' AND s.tablename = c.relname
+WHERE c.relnamespace = 'public'::regnamespace AND c.relkind IN ('r', 'm')
+ORDER BY c.relname, s.attname;
+'''
+
+# the settings the planner's cost estimates depend on
+PLANNER_SETTINGS_QUERY = '''
+SELECT name, setting FROM pg_settings WHERE category LIKE 'Query Tuning%' ORDER BY name;
+'''
+
+def normalise_statement(statement: str) -> str:
+    '''
+    Collapse whitespace and case so that trivially different spellings of the
+    same statement share a cache entry.
+    '''
+    return ' '.join(statement.lower().split())
+
+def catalog_fingerprint(cur) -> str:
+    '''
+    Hash the planner-relevant parts of the catalog (`pg_class.reltuples`,
+    `relpages` and `pg_stats`) for the public schema, and the planner's
+    cost settings (`random_page_cost`, `effective_cache_size`, `enable_*`).
+
+    :param cur: an open psycopg cursor
+    :returns: a hex digest that changes whenever the statistics or settings do
+    '''
+    cur.execute(FINGERPRINT_QUERY)
+    statistics = cur.fetchall()
+    cur.execute(PLANNER_SETTINGS_QUERY)
+    return hash_fingerprint((statistics, cur.fetchall()))
+
+def hash_fingerprint(rows) -> str:
+    '''
+    Hash the rows returned by `FINGERPRINT_QUERY` and `PLANNER_SETTINGS_QUERY`.
+    '''
+    return hashlib.sha256(repr(rows).encode()).hexdigest()
+
+class CostCache:
+    '''
+    A persistent what-if cost cache backed by a local SQLite file.
+
+    Entries are keyed by the normalised statement text, the set of
+    hypothetical indexes that were present when it was costed, and the
+    catalog fingerprint. When the fingerprint of the database differs from
+    the one the cache was written against, every entry is dropped.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fingerprint = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS costs (key TEXT PRIMARY KEY, cost REAL)')
+        self._conn.commit()
+
+    def validate(self, fingerprint: str):
+        '''
+        Bind the cache to a catalog fingerprint, invalidating every stored
+        entry if it was computed against different statistics.
+        '''
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE key = ?', ('fingerprint',)).fetchone()
+            if row is None or row[0] != fingerprint:
+                if row is not None:
+                    print('+ catalog statistics changed, invalidating cost cache', self.path)
+                self._conn.execute('DELETE FROM costs')
+                self._conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('fingerprint', fingerprint))
+                self._conn.commit()
+            self.fingerprint = fingerprint
+
+    def _key(self, kind: str, statement: str, indexes) -> str:
+        assert self.fingerprint is not None, 'validate the cache against the catalog before using it'
+        payload = json.dumps([kind, normalise_statement(statement), sorted(normalise_statement(i) for i in indexes), self.fingerprint])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _get(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT cost FROM costs WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def _put(self, key, cost):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO costs VALUES (?, ?)', (key, cost))
+
+    def get_cost(self, statement: str, indexes):
+        '''
+        :param statement: the statement (including any view definitions it depends on)
+        :param indexes: the `CREATE INDEX` strings of the hypothetical indexes present
+        :returns: the cached plan cost, or None on a miss
+        '''
+        return self._get(self._key('cost', statement, indexes))
+
+    def put_cost(self, statement: str, indexes, cost):
+        self._put(self._key('cost', statement, indexes), cost)
+
+    def get_size(self, index: str):
+        return self._get(self._key('size', index, []))
+
+    def put_size(self, index: str, size):
+        self._put(self._key('size', index, []), size)
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def close(self):
+        self.commit()
+        self._conn.close()
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = round(100 * self.hits / total, 2) if total else 0
+        return f'{self.hits} hits, {self.misses} misses ({rate}% hit rate)'
@@ -1,75 +1,909 @@
+import asyncio
+import math
 import psycopg
+import random
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from benefits import BenefitMatrix
+from cost_cache import FINGERPRINT_QUERY, PLANNER_SETTINGS_QUERY, catalog_fingerprint, hash_fingerprint
+from estimation_store import template_hashes
+from hypothetical import HypotheticalIndexManager
+from parser import parameterise_query
+from pool import AsyncConnectionPool, ConnectionPool
+from storage import catalog_index_sizes
+from surrogate import STATS_QUERY, SurrogateModel, checked
+from workload import CompiledQuery, compile_query, compile_workload
+
+@dataclass
+class CostingUnit:
+    '''
+    One compiled query that is EXPLAINed on behalf of some of the workload.
+    Its cost is multiplied by `weight` when summed into its template, which
+    starts out as the number of times the statements it stands for occur.
+    '''
+    query: CompiledQuery
+    template: int
+    weight: float
+    sources: tuple
+    generic: bool = False
 
 class CostEstimator:
-    def __init__(self, replicas, candidates, workload, templates, n_templates):
+    def __init__(self, replicas, candidates, workload, templates, n_templates, n_workers=1, cache=None, references=None, pipeline=True,
+                 costing='instance', representatives=1, sample_size=5, max_samples=None, target_error=0.05, confidence=0.95, seed=0,
+                 pool=None, store=None, storage_estimator='hypopg', storage_check=5,
+                 surrogate=False, surrogate_check=0.0):
+        assert costing in ('instance', 'generic', 'sample'), 'costing must be "instance", "generic" or "sample"'
+        assert store is None or costing != 'sample', 'incremental estimation does not support sampled costing'
+        assert storage_estimator in ('hypopg', 'catalog'), 'storage_estimator must be "hypopg" or "catalog"'
         self.replica = replicas[0]
+        self.replicas = replicas
+        self.pool = pool if pool is not None else ConnectionPool()
         self.candidates = candidates
+        # the workload may be given as compiled queries or as raw query strings
+        if workload and not isinstance(workload[0], CompiledQuery):
+            workload = compile_workload(workload, templates)
         self.workload = workload
         self.templates = templates
         self.n_candidates = len(candidates)
         self.n_templates = n_templates
+        self.n_workers = max(1, min(n_workers, self.n_candidates))
+        self.costing = costing
+        self.representatives = max(1, representatives)
+        self.sample_size = max(2, sample_size)
+        self.max_samples = max(self.sample_size, max_samples or 8 * self.sample_size)
+        self.target_error = target_error
+        self._z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+        self._rng = random.Random(seed)
+        self._unsampled = {}
+        self.instance_counts = [0 for _ in range(n_templates)]
+        for template in templates:
+            self.instance_counts[template] += 1
+        self.units = [CostingUnit(query, templates[idx], query.frequency, (idx,)) for idx, query in enumerate(workload)]
         self.baseline = []
-    
-    def get_benefits(self):
-        baseline = [0 for _ in range(self.n_templates)]
-        benefits = []
-        for _ in range(self.n_candidates):
-            benefits.append([0 for _ in range(self.n_templates)])
-        
-        with psycopg.connect(self.replica.connection_string) as conn:
+        self.query_baseline = {}
+        self.baseline_intervals = [0 for _ in range(n_templates)]
+        self.benefit_intervals = {}
+        self.sizes = {}
+        self.storage_estimator = storage_estimator
+        self.storage_check = storage_check
+        self.surrogate = surrogate
+        self.surrogate_check = surrogate_check
+        self.surrogate_model = None
+        self.surrogate_cells = {}
+        self.surrogate_misses = {}
+        self.cache = cache
+        self.store = store
+        self.fingerprint = None
+        self.hashes = {}
+        self.reused_templates = set()
+        self.reused_benefits = {}
+        self.references = references
+        self.unit_references = references
+        self.pipeline = pipeline and psycopg.Pipeline.is_supported()
+        self.round_trips = 0
+        self._round_trip_lock = threading.Lock()
+
+    def _worker_replica(self, worker):
+        '''
+        Workers are spread round-robin over every replica in `replicas.csv`.
+        '''
+        return self.replicas[worker % len(self.replicas)]
+
+    def _shards(self):
+        '''
+        Split the candidate indices into one shard per worker.
+        '''
+        return [list(range(self.n_candidates))[w::self.n_workers] for w in range(self.n_workers)]
+
+    def _map_shards(self, fn):
+        '''
+        Run `fn(worker, shard)` for every shard, each on its own thread, and
+        merge the {candidate index: result} dicts the workers return.
+        '''
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.n_workers) as pool:
+            for shard_results in pool.map(fn, range(self.n_workers), self._shards()):
+                results.update(shard_results)
+        return results
+
+    def _benefit_replicas(self):
+        '''
+        The replicas the candidates' costs are estimated on.
+        '''
+        return [self._worker_replica(worker) for worker in range(self.n_workers)]
+
+    def _other_replicas(self):
+        '''
+        The distinct replicas the candidates' costs are estimated on, other
+        than the one the baselines are costed on.
+        '''
+        others = {}
+        for replica in self._benefit_replicas():
+            if replica.connection_string != self.replica.connection_string:
+                others.setdefault(replica.connection_string, replica)
+        return list(others.values())
+
+    def _check_replica(self, replica, fingerprint, expected):
+        '''
+        A candidate's benefits are its baseline costs, from the first replica,
+        minus its costs on the replica its shard is costed on, which is only
+        sound if both replicas plan every query alike.
+        '''
+        if fingerprint != expected:
+            raise ValueError(f'replica {replica.id} has different statistics or planner settings than replica {self.replica.id}, '
+                             f'which the baseline costs are estimated on; benefits can only be sharded over identical replicas')
+
+    def _check_replicas(self, conn):
+        expected = None
+        for replica in self._other_replicas():
+            expected = expected or self.fingerprint or self._catalog_fingerprint(conn)
+            with self.pool.connection(replica) as other:
+                self._check_replica(replica, self._catalog_fingerprint(other), expected)
+
+    def _catalog_fingerprint(self, conn):
+        with conn.cursor() as cur:
+            return catalog_fingerprint(cur)
+
+    def _open_cache(self, conn):
+        if self.fingerprint is None and (self.cache is not None or self.store is not None):
+            self._set_fingerprint(self._catalog_fingerprint(conn))
+
+    def _set_fingerprint(self, fingerprint):
+        '''
+        Record the catalog fingerprint the estimation runs against, which the
+        cost cache and the estimation store are both validated with.
+        '''
+        self.fingerprint = fingerprint
+        if self.cache is not None and self.cache.fingerprint is None:
+            self.cache.validate(fingerprint)
+
+    def _run_batch(self, conn, batch, positions):
+        '''
+        Send every statement in `batch` to the server, in order, and return
+        the first result row of each statement in `positions`, keyed by batch
+        position.
+
+        In pipeline mode the whole batch is flushed at once and costs a single
+        round trip; otherwise every statement waits for its own reply.
+        '''
+        if self.pipeline:
+            with conn.pipeline():
+                cursors = [conn.execute(statement) for statement in batch]
+            trips = 1 if batch else 0
+        else:
+            cursors = [conn.execute(statement) for statement in batch]
+            trips = len(batch)
+        with self._round_trip_lock:
+            self.round_trips += trips
+        return {position: cursors[position].fetchone() for position in positions}
+
+    def _plan_batch(self, query_ids, indexes=(), prepared=None):
+        '''
+        Build the batch of statements that EXPLAINs every statement of the
+        given workload queries.
+
+        Statements whose cost is already in the cost cache are left out of the
+        batch and counted straight away. The views a query depends on are
+        created (as temporary views, so concurrent sessions on the same
+        database do not contend for the same catalog entries) the first time
+        it is costed in a session, and then left in place.
+
+        :param query_ids: indices into `self.units` of the queries to cost
+        :param indexes: the `CREATE INDEX` strings of the hypothetical indexes
+                        present in the session (for the cost cache)
+        :param prepared: the view definitions already run in the session,
+                         updated with any the batch adds
+        :returns: the partial {query index: cost} dict, the batch, and a list of
+                  (query index, cache key, batch position) for each EXPLAIN
+        '''
+        prepared = set() if prepared is None else prepared
+        costs = {}
+        batch = []
+        pending = []
+        for idx in query_ids:
+            costs[idx] = 0
+            unit = self.units[idx]
+            explain = 'EXPLAIN (GENERIC_PLAN, FORMAT JSON) %s' if unit.generic else 'EXPLAIN (FORMAT JSON) %s'
+            for key, statement in unit.query.statements:
+                if self.cache is not None and (cost := self.cache.get_cost(key, indexes)) is not None:
+                    costs[idx] += int(cost)
+                    continue
+                setup = [view for view in unit.query.setup if view not in prepared]
+                prepared.update(setup)
+                batch += setup
+                pending.append((idx, key, len(batch)))
+                batch.append(explain % statement)
+        return costs, batch, pending
+
+    def _with_setup(self, setup, batch, pending):
+        '''
+        Prefix a planned batch with `setup` statements, shifting the batch
+        positions in `pending` to match.
+        '''
+        return setup + batch, [(idx, key, position + len(setup)) for idx, key, position in pending]
+
+    def _record_costs(self, costs, pending, rows, indexes=()):
+        '''
+        Add the plan costs of a batch's EXPLAINs (`rows`, keyed by batch
+        position) to `costs` and store them in the cost cache.
+        '''
+        for idx, key, position in pending:
+            cost = rows[position][0][0]['Plan']['Total Cost']
+            if self.cache is not None:
+                self.cache.put_cost(key, indexes, cost)
+            if cost:
+                costs[idx] += int(cost)
+        return costs
+
+    def _query_costs(self, conn, query_ids, prepared=None):
+        '''
+        EXPLAIN every statement of the given workload queries in the
+        connection's session as a single batch and return a dict of
+        {query index: summed statement cost}.
+        '''
+        costs, batch, pending = self._plan_batch(query_ids, prepared=prepared)
+        if not pending:
+            return costs
+        rows = self._run_batch(conn, batch, [position for _, _, position in pending])
+        return self._record_costs(costs, pending, rows)
+
+    def _affected_queries(self, candidate):
+        '''
+        The workload queries that reference the candidate's table, ie the only
+        ones whose plans a hypothetical index on it could change.
+        '''
+        if self.references is None:
+            return range(len(self.units))
+        return self.unit_references.get(candidate.table, [])
+
+    def _probe_generic(self, conn, query):
+        '''
+        Check that every statement of a parameterised query can be costed with
+        `EXPLAIN (GENERIC_PLAN)`, which needs PostgreSQL 16 and parameters
+        whose types the planner can infer. Failures are rolled back.
+        '''
+        try:
+            with conn.transaction():
+                with conn.cursor() as cur:
+                    for view in query.setup:
+                        cur.execute(view)
+                    for _, statement in query.statements:
+                        cur.execute('EXPLAIN (GENERIC_PLAN, FORMAT JSON) %s' % statement)
+                    with self._round_trip_lock:
+                        self.round_trips += 1
+            return True
+        except psycopg.Error:
+            return False
+
+    def _instances(self):
+        '''
+        The workload indices of every template's instances, {template: [index]}.
+        '''
+        instances = {}
+        for idx, query in enumerate(self.workload):
+            instances.setdefault(query.template, []).append(idx)
+        return instances
+
+    def _frequency(self, ids):
+        return sum(self.workload[idx].frequency for idx in ids)
+
+    def _template_units(self, conn):
+        '''
+        Replace the per-instance costing units with one generic-plan unit per
+        template, weighted by how often its instances occur. Templates whose
+        parameterised text cannot be generically planned are instead costed
+        on `representatives` instances spread evenly through the template,
+        scaled up to the template's size.
+        '''
+        instances = self._instances()
+        units = []
+        n_fallback = 0
+        for template, ids in instances.items():
+            first = self.workload[ids[0]]
+            generic = compile_query(parameterise_query(first.text), template, f't{template}', first.tables)
+            if self._probe_generic(conn, generic):
+                units.append(CostingUnit(generic, template, self._frequency(ids), tuple(ids), True))
+                continue
+            n_fallback += 1
+            step = max(1, len(ids) // self.representatives)
+            chosen = ids[::step][:self.representatives]
+            for idx in chosen:
+                units.append(CostingUnit(self.workload[idx], template, self._frequency(ids) / len(chosen), tuple(ids)))
+        print(f'- {len(units)} costing units for {len(self.workload)} statements '
+              f'({len(instances) - n_fallback} generic templates, {n_fallback} costed on representatives)')
+        return units
+
+    def _sample_units(self):
+        '''
+        Replace the per-instance costing units with a simple random sample of
+        `sample_size` instances per template. `_extra_samples` grows the
+        sample where it is too noisy and `_set_baseline` scales it up.
+        '''
+        units = []
+        for template, ids in self._instances().items():
+            ids = list(ids)
+            self._rng.shuffle(ids)
+            for idx in ids[:self.sample_size]:
+                units.append(CostingUnit(self.workload[idx], template, self.workload[idx].frequency, (idx,)))
+            self._unsampled[template] = ids[self.sample_size:]
+        return units
+
+    def _units_by_template(self):
+        by_template = {}
+        for u, unit in enumerate(self.units):
+            by_template.setdefault(unit.template, []).append(u)
+        return by_template
+
+    def _interval(self, template, values):
+        '''
+        Half-width of the confidence interval on a template's summed value,
+        estimated from `values` for a simple random sample of its instances
+        (with the finite population correction, so a full sample is exact).
+        '''
+        n = self.instance_counts[template]
+        k = len(values)
+        if k >= n:
+            return 0.0
+        if k < 2:
+            return math.inf
+        return self._z * n * statistics.stdev(values) / math.sqrt(k) * math.sqrt((n - k) / (n - 1))
+
+    def _extra_samples(self, query_costs):
+        '''
+        Double the sample of every template whose baseline confidence interval
+        is wider than `target_error` of its estimate, up to `max_samples`
+        instances per template.
+
+        :param query_costs: the baseline cost of every unit so far
+        :returns: the indices of the units that were added
+        '''
+        if self.costing != 'sample':
+            return []
+        added = []
+        for template, ids in self._units_by_template().items():
+            values = [self.units[u].query.frequency * query_costs[u] for u in ids]
+            estimate = self.instance_counts[template] * statistics.fmean(values)
+            if self._interval(template, values) <= self.target_error * abs(estimate):
+                continue
+            grow = min(len(ids), self.max_samples - len(ids), len(self._unsampled[template]))
+            for idx in self._unsampled[template][:grow]:
+                added.append(len(self.units))
+                self.units.append(CostingUnit(self.workload[idx], template, self.workload[idx].frequency, (idx,)))
+            del self._unsampled[template][:grow]
+        if added:
+            print(f'- adding {len(added)} samples to templates with wide confidence intervals')
+        return added
+
+    def _prepare_units(self, conn=None):
+        '''
+        Decide what to EXPLAIN for the workload. Only generic costing needs
+        `conn`, to probe the parameterised templates.
+        '''
+        if self.costing == 'generic':
+            self.units = self._template_units(conn)
+        elif self.costing == 'sample':
+            self.units = self._sample_units()
+
+    def _map_references(self):
+        '''
+        Remap the inverted index from workload statements onto costing units.
+        '''
+        if self.references is not None:
+            self.unit_references = {}
+            for table, ids in self.references.items():
+                ids = set(ids)
+                self.unit_references[table] = [u for u, unit in enumerate(self.units) if ids.intersection(unit.sources)]
+
+    def _settings(self):
+        '''
+        The costing settings that a stored estimation must share to be reused.
+        '''
+        return self.costing, self.representatives
+
+    def _plan_reuse(self):
+        '''
+        For an incremental run, find the templates whose statements are
+        unchanged since the stored estimation and the candidates it already
+        costed. Their baselines, benefits and sizes are taken from the store,
+        so only the new template x candidate cells are EXPLAINed.
+        '''
+        if self.store is None:
+            return
+        self.hashes = template_hashes(self.workload)
+        if not self.store.reusable(self.fingerprint, self._settings()):
+            print('- no reusable estimation in', self.store.path)
+            return
+        previous = self.store.templates()
+        # matched by their statements, so templates keep their costs when they are renumbered
+        self.reused_templates = {template for template, digest in self.hashes.items() if digest in previous}
+        benefits = self.store.benefits()
+        for i, candidate in enumerate(self.candidates):
+            key = (candidate.table, candidate.column)
+            if key in benefits:
+                self.reused_benefits[i] = benefits[key]
+                self.sizes[i] = self.store.sizes()[key]
+        print(f'- reusing {len(self.reused_templates)} of {len(self.hashes)} templates and '
+              f'{len(self.reused_benefits)} of {self.n_candidates} candidates from', self.store.path)
+
+    def _baseline_units(self):
+        '''
+        The units whose baseline cost is needed: every unit, or in an
+        incremental run those of new templates and those a new candidate
+        could affect.
+        '''
+        if not self.reused_templates:
+            return range(len(self.units))
+        self._map_references()
+        units = {u for u, unit in enumerate(self.units) if unit.template not in self.reused_templates}
+        for i, candidate in enumerate(self.candidates):
+            if i not in self.reused_benefits:
+                units.update(self._affected_queries(candidate))
+        return sorted(units)
+
+    def _open_surrogate(self, conn):
+        if self.surrogate and self.surrogate_model is None:
             with conn.cursor() as cur:
-                # compute baseline
-                print('+ computing baseline query costs...')
-                for idx, query in enumerate(self.workload):
-                    for statement in query.split(';'):
-                        statement = statement.lower()
-                        if 'create view' in statement or 'drop view' in statement:
-                            cur.execute(statement)
-                        elif 'select' in statement or 'update' in statement or 'insert' in statement or 'delete' in statement:
-                            cur.execute('EXPLAIN (FORMAT JSON) %s' % statement)
-                            if after_timing := cur.fetchone()[0][0]['Plan']['Total Cost']:
-                                baseline[self.templates[idx]] += int(after_timing)
-                print('+ computing index candidate benefits for each query type')
-                for i_candidate, candidate in enumerate(self.candidates):
-                    print('-', i_candidate + 1, '/', self.n_candidates)
-                    cur.execute('SELECT indexrelid FROM hypopg_create_index($$%s$$);' % candidate.create_str())
-
-                    query_costs = [0 for _ in range(self.n_templates)]
-
-                    for i_query, query in enumerate(self.workload):
-                        for statement in query.split(';'):
-                            statement = statement.lower()
-                            if 'create view' in statement or 'drop view' in statement:
-                                cur.execute(statement)
-                            elif 'select' in statement or 'update' in statement or 'insert' in statement or 'delete' in statement:
-                                cur.execute('EXPLAIN (FORMAT JSON) %s' % statement)
-                                if after_timing := cur.fetchone()[0][0]['Plan']['Total Cost']:
-                                    query_costs[self.templates[i_query]] += int(after_timing)
-                    
-                    for template in range(self.n_templates):
-                        benefits[i_candidate][template] = baseline[template] - query_costs[template]
-                    
-                    cur.execute('SELECT hypopg_reset();')
-        
-        self.baseline = baseline
+                self.surrogate_model = SurrogateModel.from_catalog(cur)
+
+    def _surrogate_cells(self, i_candidate, query_ids):
+        '''
+        Keep the queries the surrogate model predicts the candidate can help,
+        plus a verification sample of `surrogate_check` of the skipped ones.
+        The rest are assumed to keep their baseline cost.
+        '''
+        candidate = self.candidates[i_candidate]
+        predicted = []
+        skipped = []
+        for idx in query_ids:
+            (predicted if self.surrogate_model.predict(candidate, self.units[idx].query) else skipped).append(idx)
+        sample = [idx for idx in skipped if checked(i_candidate, idx, self.surrogate_check)]
+        self.surrogate_cells[i_candidate] = (len(predicted), len(skipped), sample)
+        return sorted(predicted + sample)
+
+    def _surrogate_report(self):
+        predicted = sum(cells[0] for cells in self.surrogate_cells.values())
+        skipped = sum(cells[1] for cells in self.surrogate_cells.values())
+        print(f'- surrogate model: costed {predicted} of {predicted + skipped} candidate x query cells')
+        if n_checked := sum(len(cells[2]) for cells in self.surrogate_cells.values()):
+            misses = sum(self.surrogate_misses.values())
+            print(f'- {misses} of {n_checked} skipped cells checked had a benefit ({round(100 * misses / n_checked, 2)}% miss rate)')
+
+    def get_surrogate_miss_rate(self):
+        '''
+        The fraction of the checked skipped cells that did have a benefit, or
+        None if none were checked.
+        '''
+        n_checked = sum(len(cells[2]) for cells in self.surrogate_cells.values())
+        return sum(self.surrogate_misses.values()) / n_checked if n_checked else None
+
+    def _candidate_batch(self, i_candidate, prepared):
+        '''
+        Plan the batch that costs the queries affected by one candidate.
+        Stored candidates only need the queries of new templates, and the
+        surrogate model can rule out more.
+        '''
+        create_str = self.candidates[i_candidate].create_str()
+        query_ids = self._affected_queries(self.candidates[i_candidate])
+        if i_candidate in self.reused_benefits:
+            query_ids = [u for u in query_ids if self.units[u].template not in self.reused_templates]
+        if self.surrogate_model is not None:
+            query_ids = self._surrogate_cells(i_candidate, query_ids)
+        return self._plan_batch(query_ids, [create_str], prepared)
+
+    def _record_created(self, manager, rows):
+        '''
+        Store the oids and sizes from a batch of `manager.create_statements()`.
+        The sizes double as the candidates' storage costs.
+        '''
+        for key, row in rows.items():
+            manager.record_created(key, row)
+            self.sizes[key] = manager.sizes[key]
+            if self.cache is not None:
+                self.cache.put_size(self.candidates[key].create_str(), manager.sizes[key])
 
+    def _create_indexes(self, conn, manager):
+        creates = manager.create_statements()
+        rows = self._run_batch(conn, [statement for _, statement in creates], range(len(creates)))
+        self._record_created(manager, {key: rows[position] for position, (key, _) in enumerate(creates)})
+
+    def _candidate_benefits(self, i_candidate, query_costs):
+        '''
+        Turn the costs of the affected queries into per-template benefits.
+        Queries that cannot use the index keep their baseline cost, and so
+        contribute nothing.
+        '''
+        benefits = [0 for _ in range(self.n_templates)]
+        for idx, cost in query_costs.items():
+            benefits[self.units[idx].template] += self.units[idx].weight * (self.query_baseline[idx] - cost)
+        benefits = [round(benefit) for benefit in benefits]
+        if i_candidate in self.surrogate_cells:
+            sample = self.surrogate_cells[i_candidate][2]
+            self.surrogate_misses[i_candidate] = sum(1 for idx in sample if query_costs[idx] != self.query_baseline[idx])
+        if i_candidate in self.reused_benefits:
+            for template in self.reused_templates:
+                benefits[template] = self.reused_benefits[i_candidate][self.hashes[template]]
+
+        if self.costing == 'sample':
+            # paired differences over the whole sample; unaffected units differ by 0
+            self.benefit_intervals[i_candidate] = [0 for _ in range(self.n_templates)]
+            for template, ids in self._units_by_template().items():
+                differences = [self.units[u].query.frequency * (self.query_baseline[u] - query_costs[u]) if u in query_costs else 0
+                               for u in ids]
+                self.benefit_intervals[i_candidate][template] = self._interval(template, differences)
+
+        print('-', i_candidate + 1, '/', self.n_candidates, f'({len(query_costs)} statements, {self.round_trips} round trips)')
+        if self.cache is not None:
+            self.cache.commit()
         return benefits
 
-    def get_storage_costs(self):
-        costs = [0 for _ in range(self.n_candidates)]
+    def _shard_benefits(self, worker, shard):
+        benefits = {}
+        # every candidate in the shard is created once, hidden, and switched on in turn
+        manager = HypotheticalIndexManager({i: self.candidates[i] for i in shard})
+        prepared = set()
+        with self.pool.connection(self._worker_replica(worker)) as conn:
+            for i_candidate in shard:
+                query_costs, batch, pending = self._candidate_batch(i_candidate, prepared)
+                if pending:
+                    if not manager.created:
+                        self._create_indexes(conn, manager)
+                    batch, pending = self._with_setup(manager.toggle_statements([i_candidate]), batch, pending)
+                    rows = self._run_batch(conn, batch, [position for _, _, position in pending])
+                    self._record_costs(query_costs, pending, rows, [self.candidates[i_candidate].create_str()])
+                benefits[i_candidate] = self._candidate_benefits(i_candidate, query_costs)
+        return benefits
 
-        with psycopg.connect(self.replica.connection_string) as conn:
-            with conn.cursor() as cur:
-                print('+ computing storage costs for each index candidate')
-                for i, candidate in enumerate(self.candidates):
-                    cur.execute('SELECT indexrelid FROM hypopg_create_index($$%s$$);' % candidate.create_str())
-                    virtual_oid = cur.fetchone()[0]
-                    cur.execute('SELECT hypopg_relation_size(%s) FROM hypopg_list_indexes;' % virtual_oid)
-                    computed_size = cur.fetchone()[0]
-                    cur.execute('SELECT hypopg_drop_index(%s);' % virtual_oid)
-                    costs[i] = computed_size
-        
+    def _set_baseline(self, query_baseline):
+        '''
+        Fix the costing units once the baseline pass (including any extra
+        samples) is done, and sum their costs into the template baselines.
+        '''
+        if self.costing == 'sample':
+            for template, ids in self._units_by_template().items():
+                for u in ids:
+                    self.units[u].weight = self.units[u].query.frequency * self.instance_counts[template] / len(ids)
+                self.baseline_intervals[template] = self._interval(template, [self.units[u].query.frequency * query_baseline[u] for u in ids])
+            print(f'- costing a sample of {len(self.units)} of {len(self.workload)} statements')
+        self._map_references()
+        self.query_baseline = query_baseline
+        self.baseline = [0 for _ in range(self.n_templates)]
+        for idx, cost in query_baseline.items():
+            self.baseline[self.units[idx].template] += self.units[idx].weight * cost
+        self.baseline = [round(cost) for cost in self.baseline]
+        for template in self.reused_templates:
+            self.baseline[template] = self.store.templates()[self.hashes[template]]
+
+    def get_benefits(self):
+        with self.pool.connection(self.replica) as conn:
+            self._open_cache(conn)
+            self._check_replicas(conn)
+            self._prepare_units(conn)
+            self._open_surrogate(conn)
+            self._plan_reuse()
+            print('+ computing baseline query costs...')
+            prepared = set()
+            query_costs = self._query_costs(conn, self._baseline_units(), prepared)
+            while extra := self._extra_samples(query_costs):
+                query_costs.update(self._query_costs(conn, extra, prepared))
+            self._set_baseline(query_costs)
+
+        print('+ computing index candidate benefits for each query type', f'({self.n_workers} workers)')
+        benefits = self._map_shards(self._shard_benefits)
+        if self.cache is not None:
+            self.cache.commit()
+        print('- benefit estimation used', self.round_trips, 'round trips', '(pipelined)' if self.pipeline else '')
+        if self.surrogate_model is not None:
+            self._surrogate_report()
+
+        return BenefitMatrix.from_rows([benefits[i] for i in range(self.n_candidates)], self.n_templates)
+
+    def _storage_batch(self, shard):
+        '''
+        Plan the batch that sizes every uncached candidate in `shard`.
+
+        :returns: the partial {candidate index: size} dict, the batch, and a
+                  list of (candidate index, create string, batch position)
+        '''
+        costs = {}
+        batch = []
+        pending = []
+        for i in shard:
+            create_str = self.candidates[i].create_str()
+            if self.cache is not None and (cached := self.cache.get_size(create_str)) is not None:
+                costs[i] = int(cached)
+                continue
+            pending.append((i, create_str, len(batch)))
+            batch.append('SELECT hypopg_relation_size(indexrelid) FROM hypopg_create_index($$%s$$);' % create_str)
+        if batch:
+            batch.append('SELECT hypopg_reset();')
+        return costs, batch, pending
+
+    def _record_sizes(self, costs, pending, rows):
+        for i, create_str, position in pending:
+            costs[i] = rows[position][0]
+            if self.cache is not None:
+                self.cache.put_size(create_str, costs[i])
         return costs
 
+    def _shard_storage_costs(self, worker, shard):
+        costs, batch, pending = self._storage_batch(shard)
+        if not pending:
+            return costs
+        with self.pool.connection(self._worker_replica(worker)) as conn:
+            rows = self._run_batch(conn, batch, [position for _, _, position in pending])
+        return self._record_sizes(costs, pending, rows)
+
+    def _unsized_candidates(self):
+        '''
+        Candidates whose size was not already collected while their
+        hypothetical index existed for the benefit estimation.
+        '''
+        return [i for i in range(self.n_candidates) if i not in self.sizes]
+
+    def _storage_plan(self, unsized):
+        '''
+        With the catalog storage estimator, estimate the size of every
+        candidate in a single catalog query. Only a random sample of the
+        estimated candidates (to check the estimates against) and those that
+        cannot be estimated are still sized with hypopg.
+
+        :returns: the {candidate index: estimate} dict and the candidates to
+                  size with hypopg
+        '''
+        if self.storage_estimator != 'catalog' or not unsized:
+            return {}, unsized
+        with self.pool.connection(self.replica) as conn:
+            with conn.cursor() as cur:
+                estimates = catalog_index_sizes(cur, self.candidates)
+        estimated = [i for i in unsized if i in estimates]
+        check = set(self._rng.sample(estimated, min(self.storage_check, len(estimated))))
+        print(f'- estimated {len(estimated)} of {len(unsized)} storage costs from the catalog, checking {len(check)} with hypopg')
+        return estimates, [i for i in unsized if i not in estimates or i in check]
+
+    def _check_storage_estimates(self, estimates, costs):
+        '''
+        Report how far the catalog estimates are from every size hypopg gave,
+        then use the estimates for the candidates hypopg did not size.
+        '''
+        errors = [abs(estimate - costs[i]) / costs[i] for i, estimate in estimates.items() if costs.get(i)]
+        if errors:
+            print(f'- catalog storage estimates are off by {statistics.fmean(errors):.1%} on average '
+                  f'(at most {max(errors):.1%}) over {len(errors)} candidates sized with hypopg')
+        for i, estimate in estimates.items():
+            costs.setdefault(i, estimate)
+
+    def get_storage_costs(self):
+        costs = dict(self.sizes)
+        estimates, unsized = self._storage_plan(self._unsized_candidates())
+        if unsized:
+            if self.cache is not None and self.fingerprint is None:
+                with self.pool.connection(self.replica) as conn:
+                    self._open_cache(conn)
+
+            print('+ computing storage costs for each index candidate')
+            n_workers = min(self.n_workers, len(unsized))
+            with ThreadPoolExecutor(max_workers=n_workers) as pool:
+                for shard_costs in pool.map(self._shard_storage_costs, range(n_workers), [unsized[w::n_workers] for w in range(n_workers)]):
+                    costs.update(shard_costs)
+            if self.cache is not None:
+                self.cache.commit()
+        if estimates:
+            self._check_storage_estimates(estimates, costs)
+
+        return [costs[i] for i in range(self.n_candidates)]
+
     def get_baseline(self):
         return self.baseline
+
+    def save_estimation(self, benefits, costs):
+        '''
+        Store this run's results for the next incremental run.
+
+        :param benefits: the benefits returned by `get_benefits`
+        :param costs: the storage costs returned by `get_storage_costs`
+        '''
+        self.store.save(self.fingerprint, self._settings(), self.hashes, self.baseline, self.candidates, benefits, costs)
+
+    def get_confidence_intervals(self):
+        '''
+        The half-widths of the confidence intervals on the baseline of each
+        template and on the benefit of each candidate for each template. They
+        are only non-zero with sampled costing.
+        '''
+        benefits = [self.benefit_intervals.get(i, [0 for _ in range(self.n_templates)]) for i in range(self.n_candidates)]
+        return self.baseline_intervals, benefits
+
+
+class AsyncCostEstimator(CostEstimator):
+    '''
+    A cost estimator that drives many `psycopg.AsyncConnection`s from a single
+    asyncio event loop instead of one thread per worker. Every replica gets at
+    most `concurrency` sessions, and candidates are handed to whichever
+    session is free next. The results are the same as `CostEstimator`'s.
+    '''
+
+    def __init__(self, replicas, candidates, workload, templates, n_templates, concurrency=2, cache=None, references=None, pipeline=True,
+                 costing='instance', representatives=1, sample_size=5, max_samples=None, target_error=0.05, confidence=0.95, seed=0,
+                 pool=None, store=None, storage_estimator='hypopg', storage_check=5,
+                 surrogate=False, surrogate_check=0.0):
+        super().__init__(replicas, candidates, workload, templates, n_templates, 1, cache, references, pipeline, costing, representatives,
+                         sample_size, max_samples, target_error, confidence, seed, pool, store,
+                         storage_estimator, storage_check, surrogate, surrogate_check)
+        # asynchronous sessions are pooled for the lifetime of one event loop
+        self.async_pool = AsyncConnectionPool()
+        self.concurrency = max(1, concurrency)
+
+    async def _run_batch_async(self, conn, batch, positions):
+        '''
+        Asynchronous counterpart of `_run_batch`.
+        '''
+        if self.pipeline:
+            async with conn.pipeline():
+                cursors = [await conn.execute(statement) for statement in batch]
+            self.round_trips += 1 if batch else 0
+        else:
+            cursors = [await conn.execute(statement) for statement in batch]
+            self.round_trips += len(batch)
+        return {position: await cursors[position].fetchone() for position in positions}
+
+    async def _query_costs_async(self, conn, query_ids, prepared=None):
+        costs, batch, pending = self._plan_batch(query_ids, prepared=prepared)
+        if pending:
+            rows = await self._run_batch_async(conn, batch, [position for _, _, position in pending])
+            self._record_costs(costs, pending, rows)
+        return costs
+
+    async def _session(self, replica, queue, fn, results):
+        '''
+        One session on `replica`: take work items off the queue until it is
+        empty, storing `fn(conn, item)` in `results`.
+        '''
+        async with self.async_pool.connection(replica) as conn:
+            while not queue.empty():
+                item = queue.get_nowait()
+                results[item] = await fn(conn, item)
+
+    def _session_shards(self, items):
+        '''
+        Split `items` into one shard per session, at most `concurrency`
+        sessions per replica.
+        '''
+        n_sessions = max(1, min(len(items), self.concurrency * len(self.replicas)))
+        return [tuple(items[s::n_sessions]) for s in range(n_sessions)]
+
+    def _benefit_replicas(self):
+        n_sessions = len(self._session_shards(list(range(self.n_candidates))))
+        return [self.replicas[s % len(self.replicas)] for s in range(n_sessions)]
+
+    async def _run_sessions(self, shards, fn):
+        queue = asyncio.Queue()
+        for shard in shards:
+            queue.put_nowait(shard)
+        results = {}
+        await asyncio.gather(*[
+            self._session(self.replicas[s % len(self.replicas)], queue, fn, results)
+            for s in range(len(shards))
+        ])
+        merged = {}
+        for shard_results in results.values():
+            merged.update(shard_results)
+        return merged
+
+    async def _catalog_fingerprint_async(self, conn):
+        '''
+        Asynchronous counterpart of `catalog_fingerprint`.
+        '''
+        async with conn.cursor() as cur:
+            await cur.execute(FINGERPRINT_QUERY)
+            statistics_rows = await cur.fetchall()
+            await cur.execute(PLANNER_SETTINGS_QUERY)
+            return hash_fingerprint((statistics_rows, await cur.fetchall()))
+
+    async def _check_replicas_async(self, conn):
+        expected = None
+        for replica in self._other_replicas():
+            expected = expected or self.fingerprint or await self._catalog_fingerprint_async(conn)
+            async with self.async_pool.connection(replica) as other:
+                self._check_replica(replica, await self._catalog_fingerprint_async(other), expected)
+
+    async def _open_cache_async(self, conn):
+        if self.fingerprint is None and (self.cache is not None or self.store is not None):
+            self._set_fingerprint(await self._catalog_fingerprint_async(conn))
+
+    async def _open_surrogate_async(self, conn):
+        if self.surrogate and self.surrogate_model is None:
+            async with conn.cursor() as cur:
+                await cur.execute(STATS_QUERY)
+                self.surrogate_model = SurrogateModel(await cur.fetchall())
+
+    async def _create_indexes_async(self, conn, manager):
+        creates = manager.create_statements()
+        rows = await self._run_batch_async(conn, [statement for _, statement in creates], range(len(creates)))
+        self._record_created(manager, {key: rows[position] for position, (key, _) in enumerate(creates)})
+
+    async def _shard_benefits_async(self, conn, shard):
+        benefits = {}
+        manager = HypotheticalIndexManager({i: self.candidates[i] for i in shard})
+        prepared = set()
+        for i_candidate in shard:
+            query_costs, batch, pending = self._candidate_batch(i_candidate, prepared)
+            if pending:
+                if not manager.created:
+                    await self._create_indexes_async(conn, manager)
+                batch, pending = self._with_setup(manager.toggle_statements([i_candidate]), batch, pending)
+                rows = await self._run_batch_async(conn, batch, [position for _, _, position in pending])
+                self._record_costs(query_costs, pending, rows, [self.candidates[i_candidate].create_str()])
+            benefits[i_candidate] = self._candidate_benefits(i_candidate, query_costs)
+        return benefits
+
+    async def _get_benefits(self):
+        async with self.async_pool.connection(self.replica) as conn:
+            await self._open_cache_async(conn)
+            await self._check_replicas_async(conn)
+            if self.costing == 'generic':
+                # probing is a few sequential round trips, so a plain connection will do
+                with self.pool.connection(self.replica) as probe_conn:
+                    self._prepare_units(probe_conn)
+            else:
+                self._prepare_units()
+            await self._open_surrogate_async(conn)
+            self._plan_reuse()
+            print('+ computing baseline query costs...')
+            prepared = set()
+            query_costs = await self._query_costs_async(conn, self._baseline_units(), prepared)
+            while extra := self._extra_samples(query_costs):
+                query_costs.update(await self._query_costs_async(conn, extra, prepared))
+            self._set_baseline(query_costs)
+
+        print('+ computing index candidate benefits for each query type',
+              f'({self.concurrency} sessions per replica, {len(self.replicas)} replicas)')
+        return await self._run_sessions(self._session_shards(list(range(self.n_candidates))), self._shard_benefits_async)
+
+    async def _pooled(self, coroutine):
+        '''
+        Run `coroutine`, then close the sessions it pooled before its event
+        loop ends.
+        '''
+        try:
+            return await coroutine
+        finally:
+            await self.async_pool.close()
+
+    def get_benefits(self):
+        benefits = asyncio.run(self._pooled(self._get_benefits()))
+        if self.cache is not None:
+            self.cache.commit()
+        print('- benefit estimation used', self.round_trips, 'round trips', '(pipelined)' if self.pipeline else '')
+        if self.surrogate_model is not None:
+            self._surrogate_report()
+
+        return BenefitMatrix.from_rows([benefits[i] for i in range(self.n_candidates)], self.n_templates)
+
+    async def _shard_storage_costs_async(self, conn, shard):
+        costs, batch, pending = self._storage_batch(shard)
+        if pending:
+            rows = await self._run_batch_async(conn, batch, [position for _, _, position in pending])
+            self._record_sizes(costs, pending, rows)
+        return costs
+
+    async def _get_storage_costs(self, unsized):
+        if self.cache is not None and self.fingerprint is None:
+            async with self.async_pool.connection(self.replica) as conn:
+                await self._open_cache_async(conn)
+        return await self._run_sessions(self._session_shards(unsized), self._shard_storage_costs_async)
+
+    def get_storage_costs(self):
+        costs = dict(self.sizes)
+        estimates, unsized = self._storage_plan(self._unsized_candidates())
+        if unsized:
+            print('+ computing storage costs for each index candidate')
+            costs.update(asyncio.run(self._pooled(self._get_storage_costs(unsized))))
+            if self.cache is not None:
+                self.cache.commit()
+        if estimates:
+            self._check_storage_estimates(estimates, costs)
+
+        return [costs[i] for i in range(self.n_candidates)]
@@ -1,60 +1,88 @@
-import psycopg
-from index_candidate import IndexCandidate
+import argparse
+
+from cost_cache import CostCache
 from replica import Replica
 from parser import WorkloadParser
-
-def create_index_on(index: IndexCandidate, name, cur):
-    cur.execute('SELECT indexrelid FROM hypopg_create_index($$%s$$);' % index.create_str(name))
+from hypothetical import HypotheticalIndexManager
+from interaction import InteractionEstimator, InteractionStore
+from pool import ConnectionPool
 
 def reset_indexes(cur):
     cur.execute('SELECT hypopg_reset();')
 
-def get_benefit(query, indexes, replica):
-    conn = psycopg.connect(replica.connection_string)
-    cur = conn.cursor()
+def prepare_query(query, cur):
+    '''
+    Create the views a compiled query depends on, once per session.
+    '''
+    for view in query.setup:
+        cur.execute(view)
+
+def get_benefit(query, indexes, cur, manager):
+    manager.enable(cur, indexes)
 
-    for i, index in enumerate(indexes):
-        create_index_on(index, f'idx_{i}', cur)
-    
     cost = 0
 
-    for statement in query.split(';'):
-        if 'create view' in statement or 'drop view' in statement:
-            cur.execute(statement)
-        elif 'select' in statement:
-            cur.execute('EXPLAIN (FORMAT JSON) %s' % statement)
-            if after_timing := cur.fetchone()[0][0]['Plan']['Total Cost']:
-                cost += int(after_timing)
-    
-    reset_indexes(cur)
-    conn.close()
+    for _, statement in query.statements:
+        cur.execute('EXPLAIN (FORMAT JSON) %s' % statement)
+        if after_timing := cur.fetchone()[0][0]['Plan']['Total Cost']:
+            cost += int(after_timing)
+
     return cost
 
-def compute_delta_overlap(workload, indexes, replica):
+def compute_delta_overlap(workload, indexes, replica, pool):
     delta = 0
     s = 0
 
+    conn = pool.getconn(replica)
+    cur = conn.cursor()
+
+    # create every index once; each subset is costed by toggling visibility
+    manager = HypotheticalIndexManager(dict(enumerate(indexes)))
+    manager.create_all(cur)
+    keys = list(range(len(indexes)))
+
     for i, query in enumerate(workload):
         print(f'- {i + 1} / {len(workload)}')
-        baseline = get_benefit(query, [], replica)
+        prepare_query(query, cur)
+        baseline = get_benefit(query, [], cur, manager)
         s += baseline
         print(baseline)
-        all_cost = get_benefit(query, indexes, replica)
-        for to_remove in range(len(indexes)):
-            removed = indexes[:to_remove] + indexes[to_remove + 1:]
-            all_but_one = get_benefit(query, removed, replica)
-            marginal_benefit = get_benefit(query, [indexes[to_remove]], replica)
+        all_cost = get_benefit(query, keys, cur, manager)
+        for to_remove in keys:
+            removed = keys[:to_remove] + keys[to_remove + 1:]
+            all_but_one = get_benefit(query, removed, cur, manager)
+            marginal_benefit = get_benefit(query, [to_remove], cur, manager)
 
             this_delta = abs(all_cost - (all_but_one + marginal_benefit - baseline))
             if this_delta > delta:
                 delta = this_delta
-    
+
+    reset_indexes(cur)
+    pool.putconn(replica, conn)
     print('sum:', s)
     return delta
 
+arguments = argparse.ArgumentParser(description='pairwise index interactions of the workload in ./workload')
+arguments.add_argument('--cost-cache', type=str, help='a SQLite file to keep every EXPLAIN cost in between runs')
+arguments.add_argument('--interactions', type=str, help='a file to keep the interactions in between runs')
+args = arguments.parse_args()
+
 replica = Replica(1, 'localhost', '5432', 'tpchdb', 'sam')
-parser = WorkloadParser(replica)
+pool = ConnectionPool()
+parser = WorkloadParser(replica, pool)
 parser.read_queries('./workload')
 parser.get_all_columns()
+parser.compile_workload()
+parser.get_table_references()
 parser.extract_candidates()
-print(compute_delta_overlap(parser.get_workload(), parser.get_candidates(), replica))
\ No newline at end of file
+# pairwise interactions per template; compute_delta_overlap gives the all-but-one measure instead
+analysis = InteractionEstimator([replica], parser.get_candidates(), parser.get_compiled_workload(), parser.get_templates(),
+                                parser.get_num_templates(), 4, cache=CostCache(args.cost_cache) if args.cost_cache else None,
+                                references=parser.get_references(), pool=pool,
+                                interaction_store=InteractionStore(args.interactions) if args.interactions else None)
+interactions = analysis.get_interactions()
+for template, deltas in interactions.items():
+    if deltas:
+        print(f'- template {template}: {len(deltas)} interacting pairs, largest {max(abs(delta) for delta in deltas.values())}')
+print(analysis.max_interaction())
+print('- connection pool:', pool.stats())
\ No newline at end of file
@@ -0,0 +1,80 @@
+import hashlib
+import os
+import pickle
+
+def template_hashes(workload) -> dict:
+    '''
+    Hash the statements and frequencies of every template's instances, so
+    that a template whose queries changed between runs is costed again.
+
+    :param workload: the compiled workload
+    :returns: {template: hex digest}
+    '''
+    hashes = {}
+    for query in workload:
+        hashes.setdefault(query.template, hashlib.sha256())
+        for key, _ in query.statements:
+            hashes[query.template].update(key.encode())
+        hashes[query.template].update(f'\0{query.frequency}\0'.encode())
+    return {template: digest.hexdigest() for template, digest in hashes.items()}
+
+class EstimationStore:
+    '''
+    The results of a previous cost/benefit estimation, pickled to a file so
+    that a later run over a changed workload or candidate set only has to
+    EXPLAIN the new template x candidate cells.
+
+    Baselines and benefits are stored by the hash of a template's statements
+    rather than by its number, which changes when templates are added before
+    it, and benefits and sizes per candidate, by (table, column). Nothing is
+    reused if the catalog statistics or the costing settings have changed.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        self.previous = None
+        if os.path.exists(path):
+            with open(path, 'rb') as infile:
+                self.previous = pickle.load(infile)
+
+    def reusable(self, fingerprint: str, settings) -> bool:
+        return self.previous is not None and self.previous['fingerprint'] == fingerprint and self.previous['settings'] == settings
+
+    def templates(self) -> dict:
+        '''
+        {template hash: baseline cost} of the previous run.
+        '''
+        return self.previous['templates']
+
+    def benefits(self) -> dict:
+        '''
+        {(table, column): {template hash: benefit}} of the previous run.
+        '''
+        return self.previous['benefits']
+
+    def sizes(self) -> dict:
+        '''
+        {(table, column): storage cost} of the previous run.
+        '''
+        return self.previous['sizes']
+
+    def save(self, fingerprint, settings, hashes, baseline, candidates, benefits, sizes):
+        '''
+        :param fingerprint: the catalog fingerprint the estimation ran against
+        :param settings: the costing settings the estimation used
+        :param hashes: {template: hash} from `template_hashes`
+        :param baseline: the baseline cost of every template
+        :param candidates: the index candidates
+        :param benefits: the benefit of every candidate for every template
+        :param sizes: the storage cost of every candidate
+        '''
+        keys = [(candidate.table, candidate.column) for candidate in candidates]
+        self.previous = {
+            'fingerprint': fingerprint,
+            'settings': settings,
+            'templates': {digest: baseline[template] for template, digest in hashes.items()},
+            'benefits': {key: {digest: row[template] for template, digest in hashes.items()} for key, row in zip(keys, benefits)},
+            'sizes': dict(zip(keys, sizes)),
+        }
+        with open(self.path, 'wb') as outfile:
+            pickle.dump(self.previous, outfile)
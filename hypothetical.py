@@ -0,0 +1,63 @@
+class HypotheticalIndexManager:
+    '''
+    Keeps a fixed set of hypothetical indexes in one database session and
+    switches them on and off with `hypopg_hide_index`/`hypopg_unhide_index`,
+    instead of creating and resetting them for every configuration that is
+    costed. The size of each index is collected when it is created.
+
+    Hypothetical indexes are session-local, so a manager belongs to exactly
+    one connection. The manager only produces SQL and tracks state; the
+    statements can be executed directly (`create_all`/`enable`) or sent as
+    part of a larger pipelined batch.
+    '''
+
+    def __init__(self, candidates: dict):
+        '''
+        :param candidates: {key: index candidate} for every index to create
+        '''
+        self.candidates = candidates
+        self.oids = {}
+        self.sizes = {}
+        self.enabled = set()
+
+    @property
+    def created(self) -> bool:
+        return len(self.oids) == len(self.candidates)
+
+    def create_statements(self) -> list:
+        '''
+        One statement per candidate that creates it, sizes it and immediately
+        hides it, so every index starts disabled. Returns (key, statement).
+        '''
+        return [
+            (key, 'SELECT indexrelid, hypopg_relation_size(indexrelid), hypopg_hide_index(indexrelid) '
+                  'FROM hypopg_create_index($$%s$$);' % candidate.create_str())
+            for key, candidate in self.candidates.items()
+        ]
+
+    def record_created(self, key, row):
+        '''
+        Store the oid and size from the result row of a create statement.
+        '''
+        self.oids[key] = row[0]
+        self.sizes[key] = row[1]
+
+    def toggle_statements(self, enabled) -> list:
+        '''
+        The statements that take the session from the currently enabled set of
+        indexes to exactly `enabled`. The manager assumes they will be run.
+        '''
+        enabled = set(enabled)
+        statements = ['SELECT hypopg_hide_index(%s);' % self.oids[key] for key in sorted(self.enabled - enabled)]
+        statements += ['SELECT hypopg_unhide_index(%s);' % self.oids[key] for key in sorted(enabled - self.enabled)]
+        self.enabled = enabled
+        return statements
+
+    def create_all(self, cur):
+        for key, statement in self.create_statements():
+            cur.execute(statement)
+            self.record_created(key, cur.fetchone())
+
+    def enable(self, cur, enabled):
+        for statement in self.toggle_statements(enabled):
+            cur.execute(statement)
@@ -0,0 +1,175 @@
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+from cost_estimator import CostEstimator
+from estimation_store import template_hashes
+from hypothetical import HypotheticalIndexManager
+
+class InteractionStore:
+    '''
+    The interactions of a previous analysis, pickled to a file together with
+    what they were estimated against: the catalog fingerprint, the costing
+    settings, the candidates (by table and column) and the hash of every
+    template. They are only reused if all of these are unchanged.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        self.previous = None
+        if os.path.exists(path):
+            with open(path, 'rb') as infile:
+                self.previous = pickle.load(infile)
+
+    def load(self, key):
+        '''
+        :returns: the stored {template: {(a, b): interaction}}, or None if
+                  they were estimated against anything else
+        '''
+        if self.previous is not None and self.previous['key'] == key:
+            return self.previous['interactions']
+        return None
+
+    def save(self, key, interactions):
+        self.previous = {'key': key, 'interactions': interactions}
+        with open(self.path, 'wb') as outfile:
+            pickle.dump(self.previous, outfile)
+
+class InteractionEstimator(CostEstimator):
+    '''
+    Measures how far the benefits of pairs of index candidates are from
+    additive, which the QUBO formulation assumes. For candidates a and b the
+    interaction on a template is
+
+        benefit(a) + benefit(b) - benefit({a, b})
+
+    summed over the template's queries. It is zero when the benefits add up,
+    positive when the two indexes overlap and negative when they complement
+    each other.
+
+    A query can only have a non-zero interaction if it references the tables
+    of both candidates, so every other (pair, query) combination is pruned
+    without being costed, as are pairs that share no query at all. The single
+    candidate costs come from the usual benefit estimation, pairs are costed
+    in parallel over pooled sessions, and every EXPLAIN goes through the cost
+    cache, if one is given. With an `InteractionStore` the interactions are
+    kept between runs, so repeating an analysis of an unchanged workload,
+    candidate set and catalog EXPLAINs nothing.
+    '''
+
+    def __init__(self, *args, interaction_store=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        assert self.store is None and not self.surrogate, \
+            'interaction analysis needs every single candidate cost, so it cannot be incremental or use the surrogate model'
+        self.interaction_store = interaction_store
+        self.single_costs = {}
+        self.interactions = {}
+
+    def _candidate_benefits(self, i_candidate, query_costs):
+        self.single_costs[i_candidate] = dict(query_costs)
+        return super()._candidate_benefits(i_candidate, query_costs)
+
+    def _pairs(self):
+        '''
+        Every pair of candidates (a < b) with the queries they could both
+        affect, leaving out pairs with none.
+        '''
+        affected = [set(self._affected_queries(candidate)) for candidate in self.candidates]
+        pairs = []
+        for a in range(self.n_candidates):
+            for b in range(a + 1, self.n_candidates):
+                if shared := affected[a] & affected[b]:
+                    pairs.append((a, b, sorted(shared)))
+        return pairs
+
+    def _pair_interactions(self, a, b, query_costs):
+        '''
+        Turn the costs of the shared queries with both indexes present into
+        per-template interactions, leaving out the zero ones.
+        '''
+        interactions = [0 for _ in range(self.n_templates)]
+        for idx, cost in query_costs.items():
+            baseline = self.query_baseline[idx]
+            cost_a = self.single_costs[a].get(idx, baseline)
+            cost_b = self.single_costs[b].get(idx, baseline)
+            interactions[self.units[idx].template] += self.units[idx].weight * (baseline - cost_a - cost_b + cost)
+        return {template: round(delta) for template, delta in enumerate(interactions) if round(delta) != 0}
+
+    def _shard_interactions(self, worker, pairs):
+        interactions = {}
+        # every candidate of the shard's pairs is created once and toggled in pairs
+        manager = HypotheticalIndexManager({i: self.candidates[i] for a, b, _ in pairs for i in (a, b)})
+        prepared = set()
+        with self.pool.connection(self._worker_replica(worker)) as conn:
+            for a, b, shared in pairs:
+                indexes = [self.candidates[a].create_str(), self.candidates[b].create_str()]
+                query_costs, batch, pending = self._plan_batch(shared, indexes, prepared)
+                if pending:
+                    if not manager.created:
+                        self._create_indexes(conn, manager)
+                    batch, pending = self._with_setup(manager.toggle_statements([a, b]), batch, pending)
+                    rows = self._run_batch(conn, batch, [position for _, _, position in pending])
+                    self._record_costs(query_costs, pending, rows, indexes)
+                interactions[(a, b)] = self._pair_interactions(a, b, query_costs)
+        if self.cache is not None:
+            self.cache.commit()
+        return interactions
+
+    def get_interactions(self):
+        '''
+        Estimate the benefits (if that has not been done yet), then the
+        interaction of every pair of candidates.
+
+        :returns: {template: {(a, b): interaction}} with only the non-zero
+                  interactions
+        '''
+        key = None
+        if self.interaction_store is not None:
+            if self.fingerprint is None:
+                with self.pool.connection(self.replica) as conn:
+                    self._set_fingerprint(self._catalog_fingerprint(conn))
+            key = (self.fingerprint, self._settings(), tuple((candidate.table, candidate.column) for candidate in self.candidates),
+                   tuple(sorted(template_hashes(self.workload).items())))
+            if (stored := self.interaction_store.load(key)) is not None:
+                print('- reusing the interactions in', self.interaction_store.path)
+                self.interactions = stored
+                return self.interactions
+
+        if not self.baseline:
+            self.get_benefits()
+
+        pairs = self._pairs()
+        n_pairs = self.n_candidates * (self.n_candidates - 1) // 2
+        print('+ computing pairwise index interactions', f'({len(pairs)} of {n_pairs} pairs share a query, {self.n_workers} workers)')
+        n_workers = max(1, min(self.n_workers, len(pairs)))
+        shards = [pairs[w::n_workers] for w in range(n_workers)]
+        self.interactions = {template: {} for template in range(self.n_templates)}
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            for shard_interactions in pool.map(self._shard_interactions, range(n_workers), shards):
+                for pair, deltas in shard_interactions.items():
+                    for template, delta in deltas.items():
+                        self.interactions[template][pair] = delta
+        if self.interaction_store is not None:
+            self.interaction_store.save(key, self.interactions)
+        return self.interactions
+
+    def get_interaction_matrix(self, template):
+        '''
+        The symmetric candidate x candidate interaction matrix of a template.
+        '''
+        matrix = [[0 for _ in range(self.n_candidates)] for _ in range(self.n_candidates)]
+        for (a, b), delta in self.interactions[template].items():
+            matrix[a][b] = matrix[b][a] = delta
+        return matrix
+
+    def max_interaction(self):
+        '''
+        The largest interaction in absolute value, as (interaction, template,
+        (a, b)), or None if every pair is additive.
+        '''
+        largest = None
+        for template, deltas in self.interactions.items():
+            for pair, delta in deltas.items():
+                if largest is None or abs(delta) > abs(largest[0]):
+                    largest = (delta, template, pair)
+        return largest
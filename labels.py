@@ -0,0 +1,96 @@
+from typing import NamedTuple
+
+class Label(NamedTuple):
+    '''
+    What a QUBO variable stands for. Fields that do not apply are -1.
+
+    - x: candidate i is built on replica r
+    - t: template q is routed to replica r (when replica j has failed)
+    - p: the auxiliary variable for the product of x(i, r) and t(q, r, j)
+    - z: bit `bit` of the objective (of the failure of replica j)
+    - s: bit `bit` of the load slack of replica r (when replica j has failed)
+    - w: bit `bit` of the storage slack of replica r
+    '''
+    kind: str
+    q: int = -1
+    i: int = -1
+    r: int = -1
+    j: int = -1
+    bit: int = -1
+
+class LabelCodec:
+    '''
+    Maps the variables of the QUBOs to dense integer labels, in the order
+    they are first used, and back. Integer labels are cheaper to hash and
+    store than the names the variables used to have, and decoding a sample
+    is a lookup rather than parsing; `name` still gives those names, for
+    exports and for comparing with QUBOs that are labelled by name.
+    '''
+
+    def __init__(self):
+        # {Label: integer label}
+        self.labels = {}
+        # [Label] by integer label
+        self.keys = []
+        # {Label without its bit: [(bit, integer label)]} for the slack variables
+        self.slacks = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def encode(self, kind: str, q=-1, i=-1, r=-1, j=-1, bit=-1) -> int:
+        key = Label(kind, q, i, r, j, bit)
+        label = self.labels.get(key)
+        if label is None:
+            label = self.labels[key] = len(self.keys)
+            self.keys.append(key)
+            if bit >= 0:
+                self.slacks.setdefault(key._replace(bit=-1), []).append((bit, label))
+        return label
+
+    def decode(self, label: int) -> Label:
+        return self.keys[label]
+
+    def x(self, i, r) -> int:
+        return self.encode('x', i=i, r=r)
+
+    def t(self, q, r, j=-1) -> int:
+        return self.encode('t', q=q, r=r, j=j)
+
+    def select(self, kind: str, **fields) -> list:
+        '''
+        :returns: the labels of every variable of `kind` whose fields have the given values
+        '''
+        return [label for label, key in enumerate(self.keys)
+                if key.kind == kind and all(getattr(key, name) == value for name, value in fields.items())]
+
+    def slack_value(self, sample, kind: str, r=-1, j=-1) -> int:
+        '''
+        Decode a binary-encoded slack variable, sum_k 2^k * bit_k, from a sample.
+        Bits that are not in the sample, as in a QUBO without that slack, are 0.
+        '''
+        return sum(2 ** bit * int(sample[label]) for bit, label in self.slacks.get(Label(kind, r=r, j=j), []) if label in sample)
+
+    def name(self, label: int) -> str:
+        key = self.decode(label)
+        failed = f'-j{key.j}' if key.j >= 0 else ''
+        if key.kind == 'x':
+            return f'x-i{key.i}-r{key.r}'
+        if key.kind == 't':
+            return f't-q{key.q}-r{key.r}{failed}'
+        if key.kind == 'p':
+            # as make_quadratic names it
+            return f't-q{key.q}-r{key.r}{failed}*x-i{key.i}-r{key.r}'
+        if key.kind == 'z':
+            return f'z^({key.j})-{key.bit}' if key.j >= 0 else f'z-{key.bit}'
+        if key.kind == 's':
+            return f's-j{key.j}-r{key.r}-{key.bit}' if key.j >= 0 else f's-r{key.r}-{key.bit}'
+        if key.kind == 'w':
+            return f's-wmax-r{key.r}-{key.bit}'
+        raise ValueError(f'unknown kind of variable {key.kind}')
+
+    def names(self) -> dict:
+        '''
+        :returns: {integer label: name} for relabelling a QUBO by name
+        '''
+        return {label: self.name(label) for label in range(len(self.keys))}
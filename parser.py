@@ -1,9 +1,24 @@
-import psycopg
-import glob
+import gzip
+import json
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 
 from index_candidate import IndexCandidate
+from pool import ConnectionPool
+from workload import IDENTIFIER_REGEX, compile_workload
+
+# the rewrites of `update_query_text` other than the subquery aliases
+QUERY_REWRITES = re.compile(r";\nlimit -1|;\nlimit(?= )|limit -1| ([0-9]+) days\)")
+
+def rewrite_query(match):
+    if match.group(1) is not None:
+        return f" interval '{match.group(1)} days')"
+    if match.group(0) == ';\nlimit':
+        return ' limit'
+    # limit -1 is dropped, as is a ;\nlimit -1 but for its separating space
+    return ' ' if match.group(0).startswith(';') else ''
 
 def update_query_text(text: str) -> str:
     '''
@@ -14,39 +29,186 @@ def update_query_text(text: str) -> str:
     :param text: the text of the query to update
     :returns text: the corrected version
     '''
-    text = text.replace(";\nlimit ", " limit ").replace("limit -1", "")
-    text = re.sub(r" ([0-9]+) days\)", r" interval '\1 days')", text)
+    text = QUERY_REWRITES.sub(rewrite_query, text)
     text = add_alias_subquery(text)
     return text
 
+# an opening parenthesis after FROM or a comma, or any other parenthesis
+SUBQUERY_REGEX = re.compile(r"(?:from|,)[ \n]*\(|[()]")
+# the word after a closing parenthesis
+NEXT_WORD_REGEX = re.compile(r"\s*([^ \n]*)")
+# the words after a subquery that show it is missing an alias
+ALIAS_FOLLOWERS = ('limit', 'group', 'order', 'where')
+
 # PostgreSQL requires an alias for subqueries
 def add_alias_subquery(query_text):
+    '''
+    Insert ` as alias123 ` after every parenthesised subquery that follows
+    FROM or a comma and is followed by `)`, `,` or one of `ALIAS_FOLLOWERS`.
+    The parentheses are matched in one scan with a stack and the result is
+    joined once, so this is linear in the length of the query.
+    '''
     text = query_text.lower()
-    positions = []
-    for match in re.finditer(r"((from)|,)[  \n]*\(", text):
-        counter = 1
-        pos = match.span()[1]
-        while counter > 0:
-            char = text[pos]
-            if char == "(":
-                counter += 1
-            elif char == ")":
-                counter -= 1
-            pos += 1
-        next_word = query_text[pos:].lstrip().split(" ")[0].split("\n")[0]
-        if next_word[0] in [")", ","] or next_word in [
-            "limit",
-            "group",
-            "order",
-            "where",
-        ]:
-            positions.append(pos)
-    for pos in sorted(positions, reverse=True):
-        query_text = query_text[:pos] + " as alias123 " + query_text[pos:]
-    return query_text
+    pieces = []
+    last = 0
+    # whether each open parenthesis starts a subquery
+    open_subqueries = []
+    for match in SUBQUERY_REGEX.finditer(text):
+        if match.group() != ')':
+            open_subqueries.append(match.group() != '(')
+        elif open_subqueries and open_subqueries.pop():
+            pos = match.end()
+            next_word = NEXT_WORD_REGEX.match(query_text, pos).group(1)
+            if next_word[:1] in (')', ',') or next_word in ALIAS_FOLLOWERS:
+                pieces.append(query_text[last:pos])
+                pieces.append(' as alias123 ')
+                last = pos
+    pieces.append(query_text[last:])
+    return ''.join(pieces)
+
+LITERAL = r"(?:'(?:[^']|'')*'|-?[0-9]+(?:\.[0-9]+)?)"
+
+def parameterise_query(text: str) -> str:
+    '''
+    Replace the literals in a query's predicates with positional parameters
+    ($1, $2, ...) so that one instance can stand in for its whole template
+    when costed with `EXPLAIN (GENERIC_PLAN)`.
+
+    Typed literals (`date '...'`, `interval '...'`) become typed parameters,
+    and literals are replaced after comparison operators, `like`, `between`
+    ... `and` and inside `in (...)` lists. Everything else is left alone.
+
+    :param text: the query text of one instance
+    :returns text: the parameterised query
+    '''
+    n_params = 0
+
+    def param(suffix=''):
+        nonlocal n_params
+        n_params += 1
+        return f'${n_params}{suffix}'
+
+    text = re.sub(r"\b(date|interval|timestamp)\s+'(?:[^']|'')*'", lambda m: param(f'::{m.group(1).lower()}'), text, flags=re.IGNORECASE)
+    text = re.sub(rf"\b(between)\s+{LITERAL}\s+and\s+{LITERAL}", lambda m: f'{m.group(1)} {param()} and {param()}', text, flags=re.IGNORECASE)
+    text = re.sub(rf"\b(in)\s*\(\s*{LITERAL}(?:\s*,\s*{LITERAL})*\s*\)",
+                  lambda m: f'{m.group(1)} (' + ', '.join(param() for _ in re.findall(LITERAL, m.group(0))) + ')',
+                  text, flags=re.IGNORECASE)
+    text = re.sub(rf"(<>|!=|<=|>=|=|<|>|\blike)\s*{LITERAL}", lambda m: f'{m.group(1)} {param()}', text, flags=re.IGNORECASE)
+    return text
+
+# comments and string or quoted literals, which are skipped
+SKIPPED_REGEX = re.compile(r"--[^\n]*|/\*.*?\*/|'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"", re.S)
+# (qualified) identifiers and parentheses
+TOKEN_REGEX = re.compile(r"%s(?:\.%s)*|[()]" % (IDENTIFIER_REGEX, IDENTIFIER_REGEX))
+# keywords that end a WHERE clause at the same nesting depth; `select` starts
+# a subquery, whose select list and FROM clause are not predicates of the WHERE
+# clause it is nested in
+CLAUSE_KEYWORDS = frozenset({'select', 'group', 'order', 'limit', 'having', 'union', 'intersect', 'except', 'window', 'offset',
+                             'fetch'})
+
+def tokenize_predicates(text: str):
+    '''
+    Scan a query once and collect the identifiers it references and those
+    used in its WHERE clauses, including the WHERE clauses of subqueries.
+    Literals and comments are skipped, and both parts of a qualified name
+    (`alias.column`) are kept.
+
+    :param text: the query text
+    :returns: (every identifier, the identifiers in WHERE clauses)
+    '''
+    tokens = TOKEN_REGEX.findall(SKIPPED_REGEX.sub(' ', text.lower()))
+    predicates = []
+    # whether each open parenthesis level is inside a WHERE clause
+    in_where = [False]
+    for token in tokens:
+        if token == '(':
+            in_where.append(in_where[-1])
+        elif token == ')':
+            if len(in_where) > 1:
+                in_where.pop()
+        elif token == 'where':
+            in_where[-1] = True
+        elif token in CLAUSE_KEYWORDS:
+            in_where[-1] = False
+        elif in_where[-1]:
+            predicates.append(token)
+    return split_qualified(tokens), split_qualified(predicates)
+
+def split_qualified(names) -> set:
+    names = set(names)
+    for name in [name for name in names if '.' in name]:
+        names.update(name.split('.'))
+    return names
+
+# how duplicate statements are collapsed by `WorkloadParser.read_queries`
+DEDUP_MODES = ('exact', 'literals', 'none')
+# queries handed to the worker processes at a time
+LOAD_CHUNK = 10000
+
+def fingerprint_query(text: str, literals: bool = True) -> str:
+    '''
+    Normalise a query for deduplication: case and whitespace are collapsed
+    and, with `literals`, every string and numeric literal becomes `?`.
+    '''
+    text = ' '.join(text.lower().split())
+    if literals:
+        text = re.sub(r"'(?:[^']|'')*'|(?<![a-z0-9_$])-?[0-9]+(?:\.[0-9]+)?", '?', text)
+    return text
+
+def query_files(path):
+    '''
+    The (template, path) of every `[TEMPLATE_NO]_[QUERY_NO].sql` file in a
+    directory, ordered by template and query number.
+    '''
+    files = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.endswith('.sql') and entry.is_file():
+                template, query_num = entry.name[:-len('.sql')].rsplit('_', 1)
+                files.append((int(template), int(query_num), entry.path))
+    return [(template - 1, file) for template, _, file in sorted(files)]
+
+def load_query_file(entry):
+    template, path = entry
+    with open(path, 'r') as infile:
+        lines = infile.readlines()
+    if lines and lines[0].startswith('--'):
+        lines = lines[1:]
+    if not lines:
+        return template, None, 0
+    query = ' '.join(lines)
+    query = query.replace('\n', ' ').replace('\t', ' ')
+    return template, update_query_text(query), 1
+
+def stream_lines(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as infile:
+        for line in infile:
+            if line.strip():
+                yield line
+
+def load_query_record(line):
+    record = json.loads(line)
+    template = record.get('template')
+    query = record['query'].replace('\n', ' ').replace('\t', ' ')
+    return None if template is None else int(template) - 1, update_query_text(query), int(record.get('frequency', 1))
+
+def prepare_parallel(fn, items, n_workers=1):
+    '''
+    Apply `fn` to every item, over `n_workers` processes, and yield the
+    results in order. Items are handed out in chunks of `LOAD_CHUNK`, so a
+    long stream is never held in memory at once.
+    '''
+    if n_workers <= 1:
+        yield from map(fn, items)
+        return
+    items = iter(items)
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        while chunk := list(islice(items, LOAD_CHUNK)):
+            yield from pool.map(fn, chunk, chunksize=max(1, len(chunk) // (4 * n_workers)))
 
 class WorkloadParser:
-    def __init__(self, replica):
+    def __init__(self, replica, pool=None):
         self.workload = []
         self.queries = []
         self.updates = []
@@ -54,50 +216,81 @@ class WorkloadParser:
         self.columns = []
         self.table_of_columns = []
         self.candidates = []
+        self.references = {}
+        self.compiled = []
+        self.frequencies = []
         self.replica = replica
+        self.pool = pool if pool is not None else ConnectionPool()
         self.n_templates = -1
 
-    def read_queries(self, path):
+    def read_queries(self, path, n_workers=1, dedup='exact'):
+        '''
+        Load the workload at `path`: a directory of pregenerated
+        `[TEMPLATE_NO]_[QUERY_NO].sql` files, or a single JSONL file (which may
+        be gzipped) with one {"query": ..., "template": ..., "frequency": ...}
+        object per line. "template" and "frequency" are optional; without a
+        template, queries that differ only in their literals share one.
+
+        The queries are streamed and prepared over `n_workers` processes, and
+        duplicates are collapsed into one entry with a frequency count:
+        `dedup` 'exact' collapses identical statements, 'literals' also
+        statements that differ only in their literals, and 'none' keeps every
+        statement.
+
+        Templates are numbered 0..n_templates-1 afterwards, in the order of
+        their given numbers and then of the templates without one, so gaps in
+        the given numbers do not leave empty templates.
         '''
-        Load the pregenerated queries in the training set located at `path`.
-        Returns the query text in a list as well as which template each query belongs to.
+        assert dedup in DEDUP_MODES, f'dedup must be one of {", ".join(DEDUP_MODES)}'
+        if os.path.isdir(path):
+            records = prepare_parallel(load_query_file, query_files(path), n_workers)
+        else:
+            records = prepare_parallel(load_query_record, stream_lines(path), n_workers)
+
+        entries = {}
+        inferred = {}
+        for template, query, frequency in records:
+            if query is None:
+                continue
+            # given templates sort before the inferred ones, and never share a number with them
+            if template is None:
+                template = (1, inferred.setdefault(fingerprint_query(query), len(inferred)))
+            else:
+                template = (0, template)
+            key = (template, query if dedup == 'none' else fingerprint_query(query, dedup == 'literals'))
+            if dedup != 'none' and key in entries:
+                self.frequencies[entries[key]] += frequency
+                continue
+            entries[key] = len(self.workload)
+            self.workload.append(query)
+            self.frequencies.append(frequency)
+            self.templates.append(template)
+            if 'select' in query.lower():
+                self.queries.append(template)
+            else:
+                self.updates.append(template)
+
+        dense = {template: n for n, template in enumerate(sorted(set(self.templates)))}
+        self.templates = [dense[template] for template in self.templates]
+        self.queries = [dense[template] for template in self.queries]
+        self.updates = [dense[template] for template in self.updates]
+        self.n_templates = len(dense)
+
+    def get_all_columns(self, schema=None):
+        '''
+        Find every column in the schema, from a `SchemaSnapshot` if one is
+        given, or else by querying the replica.
         '''
-        # first: how many templates are there, and how many queries do each one of them have?
-        all_queries = glob.glob(f'{path}/*.sql')
-        query_names = [os.path.basename(q) for q in all_queries]
-        name_parts = [q.split('_') for q in query_names]
-        template_strs = list(set(['_'.join(t[:-1]) for t in name_parts]))
-        query_nums = list(set([int(q[-1].strip('.sql')) for q in name_parts]))
-
-        self.n_templates = len(template_strs)
-
-        for i, template in enumerate(template_strs):
-            #if int(template) > 10: continue
-            for query_num in query_nums:
-                try:
-                    with open(f'{path}/{template}_{query_num}.sql', 'r') as infile:
-                        lines = infile.readlines()
-                except:
-                    continue
-                if lines[0].startswith('--'):
-                    lines = lines[1:]
-                query = ' '.join(lines)
-                query = query.replace('\n', ' ').replace('\t', ' ')
-                query = update_query_text(query)
-                if 'select' in query.lower():
-                    self.workload.append(query)
-                    self.queries.append(int(template) - 1)
-                    self.templates.append(int(template) - 1)
-                else:
-                    self.workload.append(query)
-                    self.updates.append(int(template) - 1)
-                    self.templates.append(int(template) - 1)
-
-    def get_all_columns(self):
         self.columns = []
         self.table_of_columns = []
 
-        with psycopg.connect(self.replica.connection_string) as conn:
+        if schema is not None:
+            for table, column, _ in schema.columns:
+                self.columns.append(column)
+                self.table_of_columns.append(table)
+            return
+
+        with self.pool.connection(self.replica) as conn:
             with conn.cursor() as cur:
                 cur.execute('SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = \'public\';')
                 for table, column in cur.fetchall():
@@ -106,33 +299,77 @@ class WorkloadParser:
                     self.table_of_columns.append(table)
 
 
+    def compile_workload(self):
+        '''
+        Split and classify every query once, for the cost estimator and the
+        other tools that cost the workload repeatedly. `get_all_columns` must
+        have been called first, to find the tables each query references.
+        '''
+        self.compiled = compile_workload(self.workload, self.templates, set(self.table_of_columns), self.frequencies)
+        return self.compiled
+
+    def get_table_references(self):
+        '''
+        Build an inverted index from each table in the schema to the indices
+        of the workload queries that mention it. `get_all_columns` must have
+        been called first.
+        '''
+        if len(self.compiled) != len(self.workload):
+            self.compile_workload()
+        self.references = {table: [] for table in set(self.table_of_columns)}
+        for idx, query in enumerate(self.compiled):
+            for table in query.tables:
+                self.references[table].append(idx)
+        return self.references
+
     def extract_candidates(self):
-        REGEX = 'WHERE (.+?)(?:\\)|group by|order by|;)'
-        found_candidates = set()
+        '''
+        Find the columns used in the WHERE clauses of one query per template.
+        Each query is tokenized once and its identifiers are looked up in a
+        {column: tables} map, restricted to the tables the query references,
+        so a column is only a candidate on a table that the query reads.
+        '''
+        tables_of_column = {}
+        for column, table in zip(self.columns, self.table_of_columns):
+            tables_of_column.setdefault(column, []).append(table)
+        found_candidates = {}
 
         last_template = -1
         for i_t, template in enumerate(self.templates):
             if template == last_template: continue
             last_template = template
 
-            query = self.workload[i_t]
-            predicates = re.findall(REGEX, query, re.IGNORECASE)
+            identifiers, predicates = tokenize_predicates(self.workload[i_t])
+            for column in predicates:
+                for table in tables_of_column.get(column, []):
+                    if table in identifiers:
+                        found_candidates.setdefault((table, column), None)
 
-            for predicate in predicates:
-                for column in self.columns:
-                    if column in predicate:
-                        found_candidates.add(column)
-        
-        for column in found_candidates:
-            index = self.columns.index(column)
-            self.candidates.append(IndexCandidate(column, self.table_of_columns[index]))
+        for table, column in found_candidates:
+            self.candidates.append(IndexCandidate(column, table))
 
     def get_workload(self):
         return self.workload
+
+    def get_compiled_workload(self):
+        return self.compiled
     
     def get_templates(self):
         return self.templates
 
+    def get_frequencies(self):
+        return self.frequencies
+
+    def get_template_frequencies(self):
+        '''
+        How many times each template's statements occur in the workload, as
+        the frequency weights of the QUBO.
+        '''
+        frequencies = [0 for _ in range(self.n_templates)]
+        for template, frequency in zip(self.templates, self.frequencies):
+            frequencies[template] += frequency
+        return frequencies
+
     def get_num_templates(self):
         return self.n_templates
     
@@ -144,3 +381,6 @@ class WorkloadParser:
     
     def get_candidates(self):
         return self.candidates
+
+    def get_references(self):
+        return self.references
@@ -0,0 +1,199 @@
+import psycopg
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from psycopg.pq import TransactionStatus
+
+# loads the hypopg library into a new session and clears whatever a previous
+# borrower left behind in a returned one
+WARM_STATEMENT = 'SELECT hypopg_reset();'
+
+class PoolStats:
+    '''
+    Counters shared by the synchronous and asynchronous pools.
+    '''
+
+    def __init__(self):
+        self.connects = 0
+        self.borrows = 0
+        self.discarded = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.connect_time = 0.0
+
+    def borrowed(self, waited):
+        self.borrows += 1
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        self.wait_time += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def stats(self) -> str:
+        return (f'{self.connects} connections opened in {round(self.connect_time, 2)}s, {self.borrows} borrows, '
+                f'{self.peak_in_use} in use at peak, {self.discarded} discarded, '
+                f'{round(self.wait_time, 2)}s waiting (max {round(self.max_wait, 2)}s)')
+
+class ConnectionPool(PoolStats):
+    '''
+    A pool of warm `psycopg` sessions, keyed by `Replica.connection_string`
+    so that a replica listed several times in `replicas.csv` shares its
+    sessions.
+
+    Every new session has hypopg loaded before it is handed out, and every
+    returned session is committed (or rolled back, if the borrower raised)
+    and has its hypothetical indexes reset before it is reused. Sessions that
+    are broken are closed and replaced.
+    '''
+
+    def __init__(self, max_size: int = None):
+        '''
+        :param max_size: the most sessions open to one replica at a time;
+                         borrowers wait for a free one beyond that. None for
+                         no limit.
+        '''
+        super().__init__()
+        self.max_size = max_size
+        self._idle = {}
+        self._open = {}
+        self._cond = threading.Condition()
+
+    def _connect(self, replica):
+        start = time.perf_counter()
+        conn = psycopg.connect(replica.connection_string)
+        conn.execute(WARM_STATEMENT)
+        conn.commit()
+        with self._cond:
+            self.connects += 1
+            self.connect_time += time.perf_counter() - start
+        return conn
+
+    def getconn(self, replica):
+        key = replica.connection_string
+        start = time.perf_counter()
+        with self._cond:
+            idle = self._idle.setdefault(key, [])
+            while not idle and self.max_size is not None and self._open.get(key, 0) >= self.max_size:
+                self._cond.wait()
+            conn = idle.pop() if idle else None
+            if conn is None:
+                self._open[key] = self._open.get(key, 0) + 1
+            self.borrowed(time.perf_counter() - start)
+        if conn is None:
+            try:
+                conn = self._connect(replica)
+            except BaseException:
+                self._release(key)
+                raise
+        return conn
+
+    def _release(self, key, conn=None):
+        with self._cond:
+            self.in_use -= 1
+            if conn is None:
+                self._open[key] -= 1
+                self.discarded += 1
+            else:
+                self._idle[key].append(conn)
+            self._cond.notify()
+
+    def putconn(self, replica, conn, failed=False):
+        '''
+        Return a session to the pool.
+
+        :param failed: roll back the borrower's open transaction instead of
+                       committing it
+        '''
+        try:
+            if conn.info.transaction_status == TransactionStatus.INERROR or failed:
+                conn.rollback()
+            else:
+                conn.commit()
+            conn.execute(WARM_STATEMENT)
+            conn.commit()
+        except psycopg.Error:
+            conn.close()
+            conn = None
+        self._release(replica.connection_string, conn)
+
+    @contextmanager
+    def connection(self, replica):
+        '''
+        Borrow a session on `replica` for the duration of a `with` block.
+        '''
+        conn = self.getconn(replica)
+        try:
+            yield conn
+        except BaseException:
+            self.putconn(replica, conn, failed=True)
+            raise
+        self.putconn(replica, conn)
+
+    def close(self):
+        with self._cond:
+            for key, idle in self._idle.items():
+                for conn in idle:
+                    conn.close()
+                self._open[key] -= len(idle)
+                idle.clear()
+
+class AsyncConnectionPool(PoolStats):
+    '''
+    The asynchronous counterpart of `ConnectionPool`, for `AsyncConnection`s.
+    The number of sessions is bounded by the caller, so borrowers never wait.
+    Asynchronous sessions belong to the event loop they were opened in, so
+    the pool must be closed before that loop ends.
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self._idle = {}
+
+    async def getconn(self, replica):
+        idle = self._idle.setdefault(replica.connection_string, [])
+        self.borrowed(0.0)
+        if idle:
+            return idle.pop()
+        start = time.perf_counter()
+        try:
+            conn = await psycopg.AsyncConnection.connect(replica.connection_string)
+            await conn.execute(WARM_STATEMENT)
+            await conn.commit()
+        except BaseException:
+            self.in_use -= 1
+            raise
+        self.connects += 1
+        self.connect_time += time.perf_counter() - start
+        return conn
+
+    async def putconn(self, replica, conn, failed=False):
+        self.in_use -= 1
+        try:
+            if conn.info.transaction_status == TransactionStatus.INERROR or failed:
+                await conn.rollback()
+            else:
+                await conn.commit()
+            await conn.execute(WARM_STATEMENT)
+            await conn.commit()
+        except psycopg.Error:
+            await conn.close()
+            self.discarded += 1
+            return
+        self._idle[replica.connection_string].append(conn)
+
+    @asynccontextmanager
+    async def connection(self, replica):
+        conn = await self.getconn(replica)
+        try:
+            yield conn
+        except BaseException:
+            await self.putconn(replica, conn, failed=True)
+            raise
+        await self.putconn(replica, conn)
+
+    async def close(self):
+        for idle in self._idle.values():
+            for conn in idle:
+                await conn.close()
+            idle.clear()
@@ -0,0 +1,122 @@
+from dataclasses import dataclass
+
+from dimod import SampleSet
+
+from benefits import as_benefits
+
+@dataclass
+class PresolvedProblem:
+    '''
+    The QUBO inputs with every decision that is forced before annealing
+    taken out, and what is needed to put those decisions back into the
+    samples. Candidates keep their ids, so the reduced QUBO's variables are
+    a subset of the full one's.
+    '''
+    n_replicas: int
+    # the remaining Q, U, I and c for the QUBO builders; c has the benefits
+    # of the candidates fixed on every replica taken off
+    queries: list
+    updates: list
+    candidates: list
+    baseline: list
+    # {candidate: 0 or 1} for the candidates fixed on every replica
+    fixed_candidates: dict
+    # query templates that cost the same on every replica, routed to the first
+    fixed_routes: list
+    # (x variables, t variables, x-t products) of the full and the reduced problem
+    full_size: tuple
+    reduced_size: tuple
+
+    def report(self) -> str:
+        def reduction(before, after):
+            return f'{before} -> {after}' + (f' (-{100 * (before - after) / before:.1f}%)' if before else '')
+        n_fixed = sum(1 for value in self.fixed_candidates.values() if value)
+        return (f'- presolve fixed {len(self.fixed_candidates)} candidates ({n_fixed} on, {len(self.fixed_candidates) - n_fixed} off) '
+                f'and the routing of {len(self.fixed_routes)} templates\n'
+                f'-- index variables {reduction(self.full_size[0], self.reduced_size[0])}, '
+                f'routing variables {reduction(self.full_size[1], self.reduced_size[1])}, '
+                f'index-routing interactions {reduction(self.full_size[2], self.reduced_size[2])}')
+
+    def postsolve_sample(self, sample, codec) -> dict:
+        '''
+        Add the fixed variables to a sample of the reduced QUBO.
+        '''
+        full = dict(sample)
+        for r in range(self.n_replicas):
+            for i, value in self.fixed_candidates.items():
+                full[codec.x(i, r)] = value
+            for q in self.fixed_routes:
+                full[codec.t(q, r)] = 1 if r == 0 else 0
+        return full
+
+    def postsolve(self, reads: SampleSet, codec) -> SampleSet:
+        samples = [self.postsolve_sample(sample, codec) for sample in reads.samples()]
+        return SampleSet.from_samples(samples, 'BINARY', reads.record.energy, num_occurrences=reads.record.num_occurrences)
+
+def problem_size(Q, I, v, n_replicas) -> tuple:
+    '''
+    The index and routing variables of a problem, and its index-routing
+    interactions, of which there is one per replica for every stored
+    (candidate, query template) benefit.
+    '''
+    queries = set(Q)
+    n_pairs = sum(1 for i in I for t, _ in v[i].items() if t in queries)
+    return len(I) * n_replicas, len(Q) * n_replicas, n_pairs * n_replicas
+
+def presolve(Q, U, I, c, v, n_replicas, basis, costs=None, storage_budget=None) -> PresolvedProblem:
+    '''
+    Fix the decisions that are the same in some optimal solution whatever
+    the rest of the configuration is:
+
+    - a candidate that benefits no template is never built;
+    - a candidate that does not fit in the storage budget is never built;
+    - without a storage budget, a candidate that slows no template down is
+      built on every replica;
+    - on a total cost basis, a query template that no remaining candidate
+      changes costs the same on every replica, so its routing is fixed, and
+      an update template that no remaining candidate changes only adds a
+      constant, so it is left out.
+
+    On a max cost basis the routing of every query template still balances
+    the replica loads, so templates are never fixed there.
+
+    :param Q: the query templates
+    :param U: the update templates
+    :param I: the index candidates
+    :param c: the per-execution baseline of every template
+    :param v: the per-execution benefit of every candidate on every template
+    :param n_replicas: the number of replicas
+    :param basis: 'total' or 'max'
+    :param costs: the storage cost of every candidate, if storage is constrained
+    :param storage_budget: the storage budget, if storage is constrained
+    :returns: the reduced problem
+    '''
+    assert basis in ('total', 'max'), 'basis must be "total" or "max"'
+    v = as_benefits(v, len(c))
+    templates = set(Q) | set(U)
+    # the benefits that are not stored are 0
+    stored = {i: [(t, benefit) for t, benefit in v[i].items() if t in templates] for i in I}
+    fixed_candidates = {}
+    for i in I:
+        if all(benefit <= 0 for _, benefit in stored[i]):
+            fixed_candidates[i] = 0
+        elif storage_budget is not None and costs[i] > storage_budget:
+            fixed_candidates[i] = 0
+        elif storage_budget is None and all(benefit >= 0 for _, benefit in stored[i]):
+            fixed_candidates[i] = 1
+    candidates = [i for i in I if i not in fixed_candidates]
+
+    baseline = list(c)
+    for i, value in fixed_candidates.items():
+        if value:
+            for t, benefit in stored[i]:
+                baseline[t] -= benefit
+
+    queries, updates, fixed_routes = list(Q), list(U), []
+    if basis == 'total':
+        affected = {t for i in candidates for t, benefit in stored[i] if benefit != 0}
+        fixed_routes = [q for q in Q if q not in affected]
+        queries = [q for q in Q if q not in fixed_routes]
+        updates = [u for u in U if u in affected]
+    return PresolvedProblem(n_replicas, queries, updates, candidates, baseline, fixed_candidates, fixed_routes,
+                            problem_size(Q, I, v, n_replicas), problem_size(queries, candidates, v, n_replicas))
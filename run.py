@@ -1,16 +1,22 @@
 import argparse
 import pickle
 import time
-import math
-from dimod import BinaryQuadraticModel, make_quadratic, quicksum
 
 from replica import Replica
 from parser import WorkloadParser
-from cost_estimator import CostEstimator
+from cost_estimator import CostEstimator, AsyncCostEstimator
+from cost_cache import CostCache
+from estimation_store import EstimationStore
+from pool import ConnectionPool
+from schema import DEFAULT_MAX_AGE, load_schema
+from compression import cluster_templates
+from presolve import presolve
+from labels import LabelCodec
+from benefits import BenefitMatrix
 from anneal import (
     create_slack_variables,
     make_max_cost_qubo, make_total_cost_qubo, anneal,
-    make_storage_constraint, omega
+    make_storage_constraint, omega, zero_benefit_interactions
 )
 from problem import PROBLEMS
 from index_candidate import DummyIndexCandidate
@@ -35,56 +41,40 @@ def get_replicas(path='./replicas.csv') -> list[Replica]:
     return replicas
 
 
-def get_objective_value(sample):
+def get_objective_value(sample, codec):
     """
     Decode the z slack variable from a sample to get the encoded objective value.
-    z = sum_{k} 2^k * z_k, where variable names are 'z-{k}'.
+    z = sum_{k} 2^k * z_k, where z_k is labelled codec.encode('z', bit=k).
     """
-    keys = [key for key in sample if key.startswith('z-')]
-    objective = 0
-    for key in keys:
-        k = int(key.split('-')[1])
-        objective += (2 ** k) * int(sample[key])
-    return objective
+    return codec.slack_value(sample, 'z')
 
 
-def get_slack_value(sample, replica=0):
+def get_slack_value(sample, codec, replica=0):
     """
     Decode the per-replica slack variable s^(r) from a sample.
-    s^(r) = sum_{k} 2^k * s_k, where variable names are 's-r{r}-{k}'.
+    s^(r) = sum_{k} 2^k * s_k, where s_k is labelled codec.encode('s', r=r, bit=k).
     """
-    prefix = f's-r{replica}-'
-    keys = [key for key in sample if key.startswith(prefix)]
-    value = 0
-    for key in keys:
-        k = int(key.split('-')[-1])
-        value += (2 ** k) * int(sample[key])
-    return value
+    return codec.slack_value(sample, 's', r=replica)
 
 
-def get_cost(sample, replica, baseline, benefits, n_queries, n_candidates, queries, failed=-1):
+def get_cost(sample, codec, replica, baseline, benefits, n_queries, n_candidates, queries, failed=-1):
     cost = 0
-    def t(q, r):
-        if failed == -1:
-            return f't-q{q}-r{r}'
-        return f't-q{q}-r{r}-j{failed}'
-    for query in range(n_queries):
-        if query in queries and sample[t(query, replica)] == 0:
-            continue
-        cost += baseline[query]
-        for index in range(n_candidates):
-            if sample[f'x-i{index}-r{replica}'] == 1:
-                cost -= benefits[index][query]
+    routed = [query for query in range(n_queries) if query not in queries or sample[codec.t(query, replica, failed)] != 0]
+    cost += sum(baseline[query] for query in routed)
+    routed = set(routed)
+    for index in range(n_candidates):
+        if sample[codec.x(index, replica)] == 1:
+            cost -= sum(benefit for query, benefit in benefits[index].items() if query in routed)
     return cost
 
-def is_feasible(sample, n_queries):
+def is_feasible(sample, codec, n_queries):
     for q in range(n_queries):
-        ts = [v for k, v in sample.items() if f't-q{q}-' in k]
+        ts = [sample[label] for label in codec.select('t', q=q)]
         if sum(ts) == 0:
             return False
     return True
 
-def decompose_energy(sample, qubo, objective_bqm, components: dict, full_qubo_offset: float = 0.0):
+def decompose_energy(sample, qubo, objective_bqm, components: dict, codec, full_qubo_offset: float = 0.0):
     print('\n+++ energy decomposition')
     total = 0  # start with the full QUBO's offset (usually 0)
 
@@ -108,8 +98,7 @@ def decompose_energy(sample, qubo, objective_bqm, components: dict, full_qubo_of
         print(f'  !! discrepancy of {discrepancy:.2f} — check for missing components')
     
     replica_load_combined = components.get('replica_load')
-    aux_vars = [v for v in replica_load_combined.variables 
-                if '*' in str(v) or 'aux' in str(v).lower()]
+    aux_vars = [v for v in replica_load_combined.variables if codec.decode(v).kind == 'p']
     print(f'auxiliary variables in replica_load: {len(aux_vars)}')
 
 def create_arguments():
@@ -136,9 +125,54 @@ def create_arguments():
     parser.add_argument('-d', '--dry-run', action='store_true',
                         help="don't actually run the annealer")
     parser.add_argument('-p', '--problem', choices=PROBLEMS.keys(), type=str)
-    parser.add_argument('--workload-path', type=str, default='./workload')
+    parser.add_argument('--workload-path', type=str, default='./workload',
+                        help='a directory of [TEMPLATE_NO]_[QUERY_NO].sql files, or a (gzipped) JSONL file of queries')
+    parser.add_argument('--load-workers', type=int, default=1,
+                        help='number of processes that prepare the workload queries')
+    parser.add_argument('--dedup', choices=['exact', 'literals', 'none'], default='exact',
+                        help='collapse identical statements, or statements that differ only in their literals, into one weighted entry')
     parser.add_argument('--alpha', type=float, default=0.0, help='per-node failure probability')
     parser.add_argument('--log', type=str, help='where to write the recommendations')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of parallel cost estimation sessions (spread over all replicas)')
+    parser.add_argument('--cost-cache', type=str,
+                        help='SQLite file to persist what-if costs in between runs')
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads',
+                        help='run cost estimation sessions on threads or on one asyncio event loop')
+    parser.add_argument('--concurrency', type=int, default=2,
+                        help='sessions per replica for the async cost estimation engine')
+    parser.add_argument('--costing', choices=['instance', 'generic', 'sample'], default='instance',
+                        help='EXPLAIN every query instance, one generic plan per template, or a sample of instances per template')
+    parser.add_argument('--representatives', type=int, default=1,
+                        help='instances to cost per template when a generic plan is not possible')
+    parser.add_argument('--sample-size', type=int, default=5,
+                        help='initial number of instances sampled per template')
+    parser.add_argument('--max-samples', type=int,
+                        help='most instances sampled per template (default: 8x the sample size)')
+    parser.add_argument('--target-error', type=float, default=0.05,
+                        help='grow the sample of templates whose 95%% baseline confidence interval is wider than this fraction')
+    parser.add_argument('--incremental', type=str,
+                        help='file to store the estimation in; templates and candidates it already holds are not costed again')
+    parser.add_argument('--storage-estimator', choices=['hypopg', 'catalog'], default='hypopg',
+                        help='size index candidates with hypopg, or estimate them from the catalog statistics in one query')
+    parser.add_argument('--surrogate', action='store_true',
+                        help='only EXPLAIN the candidate x query cells a surrogate model predicts to have a benefit')
+    parser.add_argument('--surrogate-check', type=float, default=0.0,
+                        help='fraction of the cells the surrogate model skips to EXPLAIN anyway, to report its miss rate')
+    parser.add_argument('--schema-snapshot', type=str,
+                        help='file to keep a snapshot of the database schema in, so the workload is parsed without querying the catalog')
+    parser.add_argument('--schema-max-age', type=float, default=DEFAULT_MAX_AGE,
+                        help='seconds after which the schema snapshot is taken again')
+    parser.add_argument('--refresh-schema', action='store_true',
+                        help='take a new schema snapshot even if the current one is recent')
+    parser.add_argument('--presolve', action='store_true',
+                        help='fix the index and routing decisions that are forced before building the QUBO')
+    parser.add_argument('--cluster-tolerance', type=float,
+                        help='merge query templates whose baseline and benefits are within this fraction of each other before building the QUBO')
+    parser.add_argument('--pool-size', type=int,
+                        help='most database sessions open to one replica at a time (default: no limit)')
+    parser.add_argument('--no-pipeline', action='store_true',
+                        help="send each EXPLAIN in its own round trip instead of using psycopg's pipeline mode")
     parser.add_argument('basis', type=str, choices=['total', 'max'],
                         help='cost basis for objective function')
 
@@ -147,14 +181,11 @@ def create_arguments():
 
 def optimise(args):
     replicas = get_replicas()
-    parser = WorkloadParser(replicas[0])
-    parser.read_queries(args.workload_path)
-    parser.get_all_columns()
-    parser.extract_candidates()
 
+    # a precomputed problem needs neither the workload nor a database connection
     if args.problem:
         problem = PROBLEMS[args.problem]
-        benefits = problem.benefits
+        benefits = BenefitMatrix.from_rows(problem.benefits)
         costs = problem.weights
         true_costs = costs.copy()
         baseline = problem.baseline
@@ -164,6 +195,7 @@ def optimise(args):
         candidates = [DummyIndexCandidate(i) for i in range(len(costs))]
         n_templates = len(baseline)
         n_replicas = len(replicas)
+        frequencies = [1 for _ in range(n_templates)]
         print('+++ loaded problem', problem.name)
         print(n_templates, 'queries')
         print(n_templates, 'templates')
@@ -174,16 +206,28 @@ def optimise(args):
         for candidate in candidates:
             print('\t', candidate)
     else:
-        workload = parser.get_workload()
+        pool = ConnectionPool(args.pool_size)
+        parser = WorkloadParser(replicas[0], pool)
+        parser.read_queries(args.workload_path, args.load_workers, args.dedup)
+        schema = None
+        if args.schema_snapshot:
+            schema = load_schema(args.schema_snapshot, replicas[0], pool, args.schema_max_age, args.refresh_schema)
+        parser.get_all_columns(schema)
+        parser.compile_workload()
+        parser.get_table_references()
+        parser.extract_candidates()
+
+        workload = parser.get_compiled_workload()
         templates = parser.get_templates()
         queries = parser.get_queries()
         updates = parser.get_updates()
         candidates = parser.get_candidates()
         n_templates = parser.get_num_templates()
         n_replicas = len(replicas)
+        frequencies = parser.get_template_frequencies()
 
         print('+++ workload parsing complete')
-        print(len(workload), 'statements')
+        print(len(workload), 'statements', f'({sum(frequencies)} before deduplication)')
         print(queries)
         print(updates)
         print(n_templates, 'templates', f'({len(queries)} queries, {len(updates)} updates)')
@@ -195,26 +239,68 @@ def optimise(args):
             print('\t', candidate)
 
         print('+++ starting cost/benefit estimation')
-        estimator = CostEstimator(replicas, candidates, workload, templates, n_templates)
+        cache = CostCache(args.cost_cache) if args.cost_cache else None
+        store = EstimationStore(args.incremental) if args.incremental else None
+        if args.engine == 'async':
+            estimator = AsyncCostEstimator(replicas, candidates, workload, templates, n_templates, args.concurrency, cache, parser.get_references(), not args.no_pipeline,
+                                           args.costing, args.representatives, args.sample_size, args.max_samples, args.target_error,
+                                           pool=pool, store=store, storage_estimator=args.storage_estimator,
+                                           surrogate=args.surrogate, surrogate_check=args.surrogate_check)
+        else:
+            estimator = CostEstimator(replicas, candidates, workload, templates, n_templates, args.workers, cache, parser.get_references(), not args.no_pipeline,
+                                      args.costing, args.representatives, args.sample_size, args.max_samples, args.target_error,
+                                      pool=pool, store=store, storage_estimator=args.storage_estimator,
+                                      surrogate=args.surrogate, surrogate_check=args.surrogate_check)
         benefits = estimator.get_benefits()
         costs = estimator.get_storage_costs()
         true_costs = costs.copy()
         baseline = estimator.get_baseline()
+        if store is not None:
+            estimator.save_estimation(benefits, true_costs)
         print('+++ cost/benefit estimation complete')
+        if args.costing == 'sample':
+            baseline_intervals, benefit_intervals = estimator.get_confidence_intervals()
+            print('- 95% confidence intervals (template: baseline ± half-width, widest benefit half-width)')
+            for t in range(n_templates):
+                widest = max((benefit_intervals[i][t] for i in range(len(candidates))), default=0)
+                print(f'\t{t}: {baseline[t]} ± {baseline_intervals[t]:.0f}, benefit ± {widest:.0f}')
+        if cache is not None:
+            print('- cost cache:', cache.stats())
+            cache.close()
+        print('- connection pool:', pool.stats())
+        pool.close()
 
         print('+++ starting optimisation!')
-        for i in range(len(benefits)):
-            for j in range(len(benefits[i])):
-                benefits[i][j] = benefits[i][j] // args.benefit_normalisation_factor
+        benefits = benefits.map(lambda data: data // args.benefit_normalisation_factor)
         baseline = [max(0, b // args.benefit_normalisation_factor) for b in baseline]
         costs = [max(0, c // args.cost_normalisation_factor) for c in costs]
         STORAGE_BUDGET = args.storage_budget // args.cost_normalisation_factor
 
+    # the QUBO weighs the cost of one execution of a template by its frequency
+    execution_baseline = [b / max(1, f) for b, f in zip(baseline, frequencies)]
+    execution_benefits = benefits.scale_templates([1 / max(1, f) for f in frequencies])
+    qubo_queries, qubo_updates, qubo_candidates, qubo_frequencies = queries, updates, list(range(len(candidates))), frequencies
+    presolved = None
+    if args.presolve:
+        storage_constrained = args.storage_budget or args.problem
+        presolved = presolve(queries, updates, qubo_candidates, execution_baseline, execution_benefits, n_replicas, args.basis,
+                             costs if storage_constrained else None, STORAGE_BUDGET if storage_constrained else None)
+        print(presolved.report())
+        qubo_queries, qubo_updates, qubo_candidates = presolved.queries, presolved.updates, presolved.candidates
+        execution_baseline = presolved.baseline
+    clustering = None
+    if args.cluster_tolerance is not None:
+        clustering = cluster_templates(qubo_queries, execution_baseline, frequencies, execution_benefits, args.cluster_tolerance)
+        print(clustering.report())
+        qubo_queries, qubo_frequencies = clustering.queries, clustering.frequencies
+        execution_baseline, execution_benefits = clustering.baseline, clustering.benefits
+
     # Z_max: upper bound on the maximum possible replica workload cost.
     # Using sum(baseline) is conservative (all queries on one replica, no indexes).
-    Z_max = omega(queries, updates, [i for i in range(len(candidates))], baseline, [1 for _ in range(n_templates)], n_replicas)
+    Z_max = omega(qubo_queries, qubo_updates, qubo_candidates, execution_baseline, qubo_frequencies, n_replicas)
 
     print('- baseline:', baseline)
+    print('- frequencies:', frequencies)
     print('- benefits:', benefits)
     print('- costs:', costs)
     print('- storage budget:', STORAGE_BUDGET)
@@ -224,45 +310,50 @@ def optimise(args):
     # Storage constraints are built AFTER the main QUBO so that lam_storage
     # can be derived from replica_load_combined (available in components),
     # keeping lam_storage in the same tier as lam_routing.
-    objective_bqm = create_slack_variables('z', max(1, Z_max))  # kept for decomposition
-    if args.basis == 'max':
-        qubo, components = make_max_cost_qubo(
-            Z_max,
-            len(replicas),
-            queries,
-            updates,
-            list(range(len(candidates))),
-            baseline,
-            [1 for _ in range(n_templates)],
-            benefits,
-            1,
-            args.alpha
-        )
-    else:
-        qubo, components = make_total_cost_qubo(
-            len(replicas),
-            queries,
-            updates,
-            list(range(len(candidates))),
-            baseline,
-            [1 for _ in range(n_templates)],
-            benefits,
-            1,
-        )
-        objective_bqm = components['objective']
-
-    # Now build storage constraints calibrated from the assembled replica_load BQM.
-    if args.storage_budget or args.problem:
-        calibration_bqm = objective_bqm
-        storage_bqms = []
-        for r in range(len(replicas)):
-            sc, lam = make_storage_constraint(
-                r, candidates, costs, STORAGE_BUDGET, calibration_bqm, list(range(n_templates)), [], n_replicas, baseline
+    def build_qubo(v, codec):
+        if args.basis == 'max':
+            objective_bqm = create_slack_variables('z', max(1, Z_max), codec)  # kept for decomposition
+            qubo, components = make_max_cost_qubo(
+                Z_max,
+                len(replicas),
+                qubo_queries,
+                qubo_updates,
+                qubo_candidates,
+                execution_baseline,
+                qubo_frequencies,
+                v,
+                1,
+                args.alpha,
+                codec=codec
+            )
+        else:
+            qubo, components = make_total_cost_qubo(
+                len(replicas),
+                qubo_queries,
+                qubo_updates,
+                qubo_candidates,
+                execution_baseline,
+                qubo_frequencies,
+                v,
+                1,
+                codec=codec
             )
-            storage_bqms.append(sc)
-            qubo.update(sc)
-        components['storage'] = quicksum(storage_bqms)
-        components['lam_storage'] = lam
+            objective_bqm = components['objective']
+
+        # Now build storage constraints calibrated from the assembled replica_load BQM.
+        if args.storage_budget or args.problem:
+            calibration_bqm = objective_bqm
+            storage, lam = make_storage_constraint(
+                range(len(replicas)), candidates, costs, STORAGE_BUDGET, calibration_bqm, list(range(n_templates)), [], n_replicas, baseline,
+                qubo_candidates, codec
+            )
+            qubo.update(storage)
+            components['storage'] = storage
+            components['lam_storage'] = lam
+        return qubo, components, objective_bqm
+
+    codec = LabelCodec()
+    qubo, components, objective_bqm = build_qubo(execution_benefits, codec)
     print(f'- created {args.basis} cost QUBO '
           f'({qubo.num_variables} variables, {qubo.num_interactions} interactions)')
     print('+++ lambda values used')
@@ -274,16 +365,30 @@ def optimise(args):
 
     if args.dry_run:
         print('!!! stop due to user request')
+        # the interactions of the same QUBO with a term for every (candidate, template) pair, as it used to be built
+        n_dense = qubo.num_interactions + zero_benefit_interactions(
+            len(replicas), qubo_queries, qubo_updates, qubo_candidates, execution_baseline, qubo_frequencies, execution_benefits,
+            args.alpha, args.basis)
+        qubo_templates = set(qubo_queries) | set(qubo_updates)
+        n_benefits = sum(1 for i in qubo_candidates for t, _ in execution_benefits[i].items() if t in qubo_templates)
+        print(f'- interactions: {n_dense} with every candidate-template pair, '
+              f'{qubo.num_interactions} with the {n_benefits} non-zero benefits '
+              f'of {len(qubo_candidates) * len(qubo_templates)} pairs')
         print('- indexes for export:')
         print([c.column for c in candidates])
         with open('model.pkl', 'wb') as outfile:
-            pickle.dump(qubo.to_qubo(), outfile)
+            # by name, as the model has always been exported
+            pickle.dump(qubo.relabel_variables(codec.names(), inplace=False).to_qubo(), outfile)
         return
 
     print('+++ starting annealing')
     tic = time.time()
     reads = anneal(qubo, 'qaoa' if args.qaoa else 'anneal', 'quantum' if args.quantum else 'simulate', args.num_reads)
     toc = time.time()
+    if clustering is not None:
+        reads = clustering.expand(reads, codec)
+    if presolved is not None:
+        reads = presolved.postsolve(reads, codec)
 
     best_cost = float('inf')
     result = None
@@ -291,7 +396,7 @@ def optimise(args):
         read_pred_costs = []
         for r in range(len(replicas)):
             read_pred_costs.append(
-                get_cost(read.sample, r, baseline, benefits, n_templates, len(candidates), queries)
+                get_cost(read.sample, codec, r, baseline, benefits, n_templates, len(candidates), queries)
             )
         if args.basis == 'max':
             this_cost = max(read_pred_costs)
@@ -307,29 +412,27 @@ def optimise(args):
 
     print(f'+++ ! annealing complete in {round(toc - tic, 2)}s')
     print('energy', result.energy)
-    print('objective (z)', get_objective_value(result.sample))
+    print('objective (z)', get_objective_value(result.sample, codec))
     if args.basis == 'max':
         for r in range(len(replicas)):
-            print(f'slack s^({r})', get_slack_value(result.sample, r))
+            print(f'slack s^({r})', get_slack_value(result.sample, codec, r))
         
         for r in range(len(replicas)):
-            z_val = sum(2**k * int(result.sample[f'z-{k}']) 
-                        for k in range(math.floor(math.log2(Z_max)) + 1))
+            z_val = get_objective_value(result.sample, codec)
             load_val = sum(
-                result.sample[f't-q{q}-r{r}'] * (
+                result.sample[codec.t(q, r)] * (
                     1 * baseline[q] / 1 - 
-                    sum(1 * benefits[i][q] / 1 * int(result.sample[f'x-i{i}-r{r}']) 
+                    sum(1 * benefits[i][q] / 1 * int(result.sample[codec.x(i, r)]) 
                         for i in range(len(candidates)))
                 )
                 for q in queries
             )
-            slack_val = sum(2**k * int(result.sample[f's-r{r}-{k}']) 
-                        for k in range(math.floor(math.log2(Z_max)) + 1))
+            slack_val = get_slack_value(result.sample, codec, r)
             residual = z_val - load_val - slack_val
             print(f'replica {r}: z={z_val:.3f}, load={load_val:.3f}, '
                 f'slack={slack_val:.3f}, residual={residual:.3f}')
 
-    indexes, routes, pred_costs = extract_configuration(result, replicas, queries, updates, baseline, benefits, candidates, costs, true_costs, n_templates, STORAGE_BUDGET)
+    indexes, routes, pred_costs = extract_configuration(result, codec, replicas, queries, updates, baseline, benefits, candidates, costs, true_costs, n_templates, STORAGE_BUDGET)
 
     if args.log:
         with open(args.log, 'w') as outfile:
@@ -351,7 +454,7 @@ def optimise(args):
             if args.alpha > 0:
                 for r in range(len(replicas)):
                     outfile.write(f'replica-{r}-failed\n')
-                    f_indexes, f_routes, f_pred_costs = extract_configuration(result, replicas, queries, updates, baseline, benefits, candidates, costs, true_costs, n_templates, STORAGE_BUDGET, r)
+                    f_indexes, f_routes, f_pred_costs = extract_configuration(result, codec, replicas, queries, updates, baseline, benefits, candidates, costs, true_costs, n_templates, STORAGE_BUDGET, r)
                     idx_string = []
                     for i_r, config in enumerate(f_indexes):
                         for index in config:
@@ -369,7 +472,7 @@ def optimise(args):
 
     # Energy decomposition: shows relative scale of objective vs each penalty term
     if args.basis == 'max':
-        decompose_energy(result, qubo, objective_bqm, components, qubo.offset)
+        decompose_energy(result, qubo, objective_bqm, components, codec, qubo.offset)
 
     print('- Index output for benchmarking module')
     idx_string = []
@@ -392,22 +495,17 @@ def optimise(args):
         read_pred_costs = []
         for r in range(len(replicas)):
             read_pred_costs.append(
-                get_cost(read.sample, r, baseline, benefits, n_templates, len(candidates), queries)
+                get_cost(read.sample, codec, r, baseline, benefits, n_templates, len(candidates), queries)
             )
         print(f'{i}\tenergy {read.energy:.4f}\t'
-              f'objective {get_objective_value(read.sample)}\t'
+              f'objective {get_objective_value(read.sample, codec)}\t'
               f'cost {basis_fn(read_pred_costs)}')
 
-def extract_configuration(result, replicas, queries, updates, baseline, benefits, candidates, costs, true_costs, n_templates, STORAGE_BUDGET, failed=-1):
+def extract_configuration(result, codec, replicas, queries, updates, baseline, benefits, candidates, costs, true_costs, n_templates, STORAGE_BUDGET, failed=-1):
     indexes = []
     routes = [-1 for _ in range(n_templates)]
     pred_costs = []
 
-    def t(q, r):
-        if failed == -1:
-            return f't-q{q}-r{r}'
-        return f't-q{q}-r{r}-j{failed}'
-
     if failed == -1:
         print('================= BASELINE CASE =================')
     else:
@@ -418,12 +516,12 @@ def extract_configuration(result, replicas, queries, updates, baseline, benefits
         if r == failed: continue
         space = 0
         coeff_space = 0
-        pred_cost = get_cost(result.sample, r, baseline, benefits, len(queries), len(candidates), queries, failed)
+        pred_cost = get_cost(result.sample, codec, r, baseline, benefits, len(queries), len(candidates), queries, failed)
         pred_costs.append(pred_cost)
         print(f'- Replica {r}')
         print(f'-- Predicted query cost: {pred_cost}')
         for i in range(len(candidates)):
-            if result.sample[f'x-i{i}-r{r}'] == 1:
+            if result.sample[codec.x(i, r)] == 1:
                 indexes[r].append(candidates[i])
                 print('\t', candidates[i])
                 space += true_costs[i]
@@ -432,7 +530,7 @@ def extract_configuration(result, replicas, queries, updates, baseline, benefits
             if q in updates:
                 routes[q] = -1
                 continue
-            if result.sample[t(q, r)] == 1:
+            if result.sample[codec.t(q, r, failed)] == 1:
                 if routes[q] != -1:
                     print(f'!! warn: query {q} routed to multiple replicas. inspect output!')
                 routes[q] = r
@@ -0,0 +1,88 @@
+import json
+import os
+import time
+from dataclasses import dataclass
+
+# every column of the tables and views in the public schema, with its
+# average width and the row count of its table
+SCHEMA_QUERY = '''
+SELECT c.relname, a.attname, COALESCE(s.avg_width, NULLIF(a.attlen, -1)), c.reltuples
+FROM pg_class c
+JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+LEFT JOIN pg_stats s ON s.schemaname = 'public' AND s.tablename = c.relname AND s.attname = a.attname
+WHERE c.relnamespace = 'public'::regnamespace AND c.relkind IN ('r', 'v', 'f', 'p')
+ORDER BY c.relname, a.attnum;
+'''
+
+# a day
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+def database_of(replica) -> str:
+    return f'{replica.hostname}:{replica.port}/{replica.dbname}'
+
+@dataclass
+class SchemaSnapshot:
+    '''
+    The tables and columns of a database, saved to a file so that the
+    workload can be parsed without connecting to it.
+    '''
+    # the host, port and database the snapshot was taken from
+    database: str
+    # when it was taken, in seconds since the epoch
+    created: float
+    # (table, column, average width in bytes or None) for every column
+    columns: list
+    # {table: estimated row count, or -1 if it has never been analysed}
+    rows: dict
+
+    @classmethod
+    def from_catalog(cls, cur, database: str):
+        cur.execute(SCHEMA_QUERY)
+        columns = []
+        rows = {}
+        for table, column, width, reltuples in cur.fetchall():
+            if 'hypopg' in table: continue
+            columns.append((table, column, width))
+            rows[table] = reltuples
+        return cls(database, time.time(), columns, rows)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, 'r') as infile:
+            snapshot = json.load(infile)
+        snapshot['columns'] = [tuple(column) for column in snapshot['columns']]
+        return cls(**snapshot)
+
+    def save(self, path: str):
+        # written to a temporary file first, so a failed run cannot leave half a snapshot
+        with open(f'{path}.tmp', 'w') as outfile:
+            json.dump(self.__dict__, outfile)
+        os.replace(f'{path}.tmp', path)
+
+    def is_stale(self, database: str, max_age: float = DEFAULT_MAX_AGE) -> bool:
+        return self.database != database or time.time() - self.created > max_age
+
+def load_schema(path: str, replica, pool, max_age: float = DEFAULT_MAX_AGE, refresh: bool = False) -> SchemaSnapshot:
+    '''
+    Load the schema snapshot at `path`, taking a new one from `replica`
+    (and saving it) if there is none, if it is stale or if `refresh` is set.
+
+    :param path: where the snapshot is kept
+    :param replica: the replica to take a snapshot of
+    :param pool: the connection pool to connect to it through
+    :param max_age: how many seconds a snapshot is used for
+    :param refresh: take a new snapshot regardless
+    :returns: the snapshot
+    '''
+    database = database_of(replica)
+    if not refresh and os.path.exists(path):
+        snapshot = SchemaSnapshot.load(path)
+        if not snapshot.is_stale(database, max_age):
+            print('- using the schema snapshot in', path)
+            return snapshot
+    with pool.connection(replica) as conn:
+        with conn.cursor() as cur:
+            snapshot = SchemaSnapshot.from_catalog(cur, database)
+    snapshot.save(path)
+    print('- saved a new schema snapshot to', path)
+    return snapshot
@@ -0,0 +1,60 @@
+import math
+
+# row counts and column widths for every column of the candidates' tables
+CATALOG_QUERY = '''
+SELECT c.relname, a.attname, c.reltuples, COALESCE(s.avg_width, NULLIF(a.attlen, -1))
+FROM pg_class c
+JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+LEFT JOIN pg_stats s ON s.schemaname = 'public' AND s.tablename = c.relname AND s.attname = a.attname
+WHERE c.relnamespace = 'public'::regnamespace AND c.relkind IN ('r', 'm') AND c.relname = ANY(%s);
+'''
+
+BLOCK_SIZE = 8192
+# page header and btree special space
+PAGE_OVERHEAD = 24 + 16
+# index tuple header and line pointer
+TUPLE_OVERHEAD = 8
+LINE_POINTER = 4
+
+def maxalign(size: int) -> int:
+    return (size + 7) & ~7
+
+def btree_size(reltuples: float, width: int, fillfactor: int = 90) -> int:
+    '''
+    Estimate the size of a single-column btree index: every leaf tuple holds
+    the aligned key, its header and a line pointer, leaf pages are filled to
+    `fillfactor`, and the internal levels and the metapage are added on top.
+
+    :param reltuples: the number of rows in the table
+    :param width: the average width of the column in bytes
+    :returns: the size in bytes
+    '''
+    line_size = maxalign(TUPLE_OVERHEAD + maxalign(width)) + LINE_POINTER
+    usable = (BLOCK_SIZE - PAGE_OVERHEAD) * fillfactor / 100
+    leaf_pages = math.ceil(max(reltuples, 0) * line_size / usable)
+    fanout = max(2, (BLOCK_SIZE - PAGE_OVERHEAD) // line_size)
+    pages = leaf_pages
+    level = leaf_pages
+    while level > 1:
+        level = math.ceil(level / fanout)
+        pages += level
+    return (pages + 1) * BLOCK_SIZE
+
+def catalog_index_sizes(cur, candidates) -> dict:
+    '''
+    Estimate the size of every candidate's index from the catalog in a
+    single query. Candidates on tables that have never been analysed, or on
+    variable-width columns without statistics, are left out.
+
+    :param cur: an open psycopg cursor
+    :param candidates: the index candidates
+    :returns: {candidate index: estimated size in bytes}
+    '''
+    cur.execute(CATALOG_QUERY, (sorted({candidate.table for candidate in candidates}),))
+    columns = {(table, column): (reltuples, width) for table, column, reltuples, width in cur.fetchall()}
+    sizes = {}
+    for i, candidate in enumerate(candidates):
+        reltuples, width = columns.get((candidate.table, candidate.column), (-1, None))
+        if reltuples >= 0 and width is not None:
+            sizes[i] = btree_size(reltuples, width)
+    return sizes
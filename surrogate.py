@@ -0,0 +1,55 @@
+import zlib
+
+# distinct values per column, to estimate how selective an index on it can be
+STATS_QUERY = '''
+SELECT s.tablename, s.attname, s.n_distinct, c.reltuples
+FROM pg_stats s
+JOIN pg_class c ON c.relname = s.tablename AND c.relnamespace = 'public'::regnamespace
+WHERE s.schemaname = 'public';
+'''
+
+class SurrogateModel:
+    '''
+    A cheap predictor of which (candidate, query) cells of the benefit
+    matrix can be non-zero, so that only those are EXPLAINed.
+
+    A cell is predicted non-zero when the query references the candidate's
+    column and an equality predicate on the column is selective enough for
+    an index to be worth using (1 / distinct values at most
+    `max_selectivity`). Columns without statistics are always costed.
+    '''
+
+    def __init__(self, rows, max_selectivity: float = 0.2):
+        '''
+        :param rows: the rows returned by `STATS_QUERY`
+        :param max_selectivity: the least selective column still costed
+        '''
+        self.max_selectivity = max_selectivity
+        self.selectivity = {}
+        for table, column, n_distinct, reltuples in rows:
+            distinct = -n_distinct * max(reltuples, 0) if n_distinct < 0 else n_distinct
+            if distinct > 0:
+                self.selectivity[(table, column)] = 1 / distinct
+
+    @classmethod
+    def from_catalog(cls, cur, max_selectivity: float = 0.2):
+        cur.execute(STATS_QUERY)
+        return cls(cur.fetchall(), max_selectivity)
+
+    def predict(self, candidate, query) -> bool:
+        '''
+        :param candidate: an index candidate
+        :param query: a compiled query that references the candidate's table
+        :returns: whether the candidate could change the query's cost
+        '''
+        if candidate.column not in query.identifiers:
+            return False
+        selectivity = self.selectivity.get((candidate.table, candidate.column))
+        return selectivity is None or selectivity <= self.max_selectivity
+
+def checked(i_candidate: int, idx: int, fraction: float) -> bool:
+    '''
+    Whether a skipped cell is in the verification sample. The choice is a
+    hash of the cell, so it does not depend on which worker costs it.
+    '''
+    return zlib.crc32(f'{i_candidate}-{idx}'.encode()) < fraction * 2 ** 32
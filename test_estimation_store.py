@@ -0,0 +1,27 @@
+from cost_estimator import CostEstimator
+from estimation_store import EstimationStore
+from index_candidate import IndexCandidate
+
+QUERIES = ['select * from t where a = 1', 'select * from t where b = 1', 'select * from t where c = 1']
+
+def estimator(workload, templates, store):
+    candidates = [IndexCandidate('a', 't'), IndexCandidate('b', 't')]
+    estimator = CostEstimator([None], candidates, workload, templates, len(set(templates)), store=store)
+    estimator.fingerprint = 'statistics'
+    return estimator
+
+def test_renumbered_templates_are_reused(tmp_path):
+    path = str(tmp_path / 'estimation.pkl')
+    previous = estimator([QUERIES[0], QUERIES[2]], [0, 1], EstimationStore(path))
+    previous._plan_reuse()
+    previous.store.save(previous.fingerprint, previous._settings(), previous.hashes, [100, 300], previous.candidates,
+                        [[10, 0], [0, 30]], [1, 2])
+
+    # a new template between the two renumbers the second one
+    current = estimator(QUERIES, [0, 1, 2], EstimationStore(path))
+    current._plan_reuse()
+    assert current.reused_templates == {0, 2}
+    assert current.reused_benefits.keys() == {0, 1}
+    current._set_baseline({1: 200})
+    assert current.baseline == [100, 200, 300]
+    assert current._candidate_benefits(1, {}) == [0, 0, 30]
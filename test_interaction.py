@@ -0,0 +1,21 @@
+from estimation_store import template_hashes
+from index_candidate import IndexCandidate
+from interaction import InteractionEstimator, InteractionStore
+
+def analysis(path, fingerprint='statistics'):
+    candidates = [IndexCandidate('a', 't'), IndexCandidate('b', 't')]
+    estimator = InteractionEstimator([None], candidates, ['select * from t where a = 1 and b = 2'], [0], 1,
+                                     interaction_store=InteractionStore(path))
+    estimator.fingerprint = fingerprint
+    return estimator
+
+def test_stored_interactions_are_reused(tmp_path):
+    path = str(tmp_path / 'interactions.pkl')
+    previous = analysis(path)
+    key = (previous.fingerprint, previous._settings(), (('t', 'a'), ('t', 'b')),
+           tuple(sorted(template_hashes(previous.workload).items())))
+    previous.interaction_store.save(key, {0: {(0, 1): 42}})
+
+    # a rerun against the same catalog reads them back without costing anything
+    assert analysis(path).get_interactions() == {0: {(0, 1): 42}}
+    assert InteractionStore(path).load(('other statistics',) + key[1:]) is None
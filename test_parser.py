@@ -0,0 +1,78 @@
+import random
+
+from benchmark import TPCH_SUBQUERY_QUERIES, legacy_update_query_text, synthetic_subquery_query
+from parser import WorkloadParser, tokenize_predicates, update_query_text
+
+def parser_of(workload, schema):
+    parser = WorkloadParser(None)
+    parser.workload = workload
+    parser.templates = list(range(len(workload)))
+    parser.n_templates = len(workload)
+    for table, columns in schema.items():
+        parser.columns += columns
+        parser.table_of_columns += [table] * len(columns)
+    return parser
+
+def test_predicates_of_nested_where_clauses():
+    _, predicates = tokenize_predicates('select a from t where x = 1 and y in (select b from u where c > 2) and z < 3 group by d')
+    assert {'x', 'y', 'c', 'z'} <= predicates
+    assert not {'a', 'b', 'd', 't', 'u'} & predicates
+
+def test_subquery_select_list_is_not_a_predicate():
+    _, predicates = tokenize_predicates('select o_totalprice from orders where o_orderkey in (select l_orderkey from lineitem)')
+    assert 'o_orderkey' in predicates
+    assert not {'l_orderkey', 'lineitem'} & predicates
+
+def test_literals_comments_and_qualified_names():
+    _, predicates = tokenize_predicates("select * from part p where p.p_brand = 'p_size' -- p_type\n and p_container like '%x%'")
+    assert {'p', 'p_brand', 'p_container'} <= predicates
+    assert not {'p_size', 'p_type'} & predicates
+
+def test_candidates_are_predicate_columns_of_referenced_tables():
+    parser = parser_of(
+        ['select o_totalprice from orders where o_orderkey in (select l_orderkey from lineitem where l_tax > 0);',
+         'select ps_suppkey from partsupp where ps_suppkey = 1;'],
+        {'orders': ['o_orderkey', 'o_totalprice'], 'lineitem': ['l_orderkey', 'l_tax'],
+         'partsupp': ['ps_suppkey'], 'supplier': ['s_suppkey']})
+    parser.extract_candidates()
+    assert {(candidate.table, candidate.column) for candidate in parser.get_candidates()} == \
+        {('orders', 'o_orderkey'), ('lineitem', 'l_tax'), ('partsupp', 'ps_suppkey')}
+
+def test_sparse_and_inferred_templates_are_numbered_densely(tmp_path):
+    path = tmp_path / 'workload.jsonl'
+    path.write_text('\n'.join([
+        '{"query": "select * from t where a = 1", "template": 7}',
+        '{"query": "select * from t where b = 1"}',
+        '{"query": "select * from t where a = 2", "template": 3}',
+        '{"query": "update t set a = 1", "template": 7, "frequency": 2}',
+        '{"query": "select * from t where b = 1"}',
+    ]))
+    parser = WorkloadParser(None)
+    parser.read_queries(str(path))
+    assert parser.get_num_templates() == 3
+    assert parser.get_templates() == [1, 2, 0, 1]
+    assert parser.get_template_frequencies() == [1, 3, 2]
+    assert parser.get_queries() == [0, 1, 2]
+    assert parser.get_updates() == [1]
+
+def test_template_directory_with_a_gap(tmp_path):
+    for name, query in [('1_1', 'select * from t where a = 1'), ('3_1', 'select * from t where b = 1'),
+                        ('3_2', 'select * from t where b = 2')]:
+        (tmp_path / f'{name}.sql').write_text(query)
+    parser = WorkloadParser(None)
+    parser.read_queries(str(tmp_path))
+    assert parser.get_num_templates() == 2
+    assert parser.get_templates() == [0, 1, 1]
+    assert parser.get_template_frequencies() == [1, 2]
+
+def test_rewrite_matches_legacy_rewrite():
+    for query in TPCH_SUBQUERY_QUERIES:
+        assert update_query_text(query) == legacy_update_query_text(query), query
+    rng = random.Random(0)
+    for _ in range(1000):
+        query = synthetic_subquery_query(rng, rng.randint(1, 50))
+        assert update_query_text(query) == legacy_update_query_text(query), query
+
+def test_rewrite_of_unbalanced_subquery():
+    query = 'select * from (select * from (select 1) where a < 3'
+    assert update_query_text(query) == 'select * from (select * from (select 1) as alias123  where a < 3'
@@ -0,0 +1,10 @@
+from benefits import BenefitMatrix
+from presolve import presolve
+
+def test_interactions_are_counted_over_stored_benefits():
+    # candidate 0 helps template 0 only, candidate 1 helps nothing, candidate 2 helps templates 0 and 1
+    v = BenefitMatrix.from_rows([[5, 0, 0], [0, 0, 0], [3, 4, -1]])
+    presolved = presolve([0, 1], [2], [0, 1, 2], [10, 10, 10], v, 2, 'max')
+    assert presolved.fixed_candidates == {0: 1, 1: 0}
+    assert presolved.full_size == (6, 4, 6)
+    assert presolved.reduced_size == (2, 4, 4)
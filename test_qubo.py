@@ -0,0 +1,85 @@
+import random
+import warnings
+
+import pytest
+
+from anneal import make_max_cost_qubo, make_total_cost_qubo, omega, zero_benefit_interactions
+from benefits import BenefitMatrix
+from benchmark import build_max_cost_qubo, legacy_make_max_cost_qubo, legacy_square, load_constraint, square_constraint, synthetic_problem
+from problem import PROBLEMS
+
+def consistent_sample(bqm, seed):
+    '''
+    A random assignment of the variables of a QUBO in which every
+    auxiliary variable `a*b` equals the product of its factors. Each
+    variable's value depends only on its name and `seed`, so QUBOs over the
+    same variables get the same assignment.
+    '''
+    def value(name):
+        return random.Random(f'{seed}-{name}').randint(0, 1)
+    return {variable: int(all(value(factor) for factor in str(variable).split('*'))) for variable in bqm.variables}
+
+def assert_same_energies(a, b, n_samples=20):
+    '''
+    Two QUBOs over the same problem variables have the same energy, relative
+    to its size, on random consistent assignments. Their auxiliary variables
+    can differ, as make_quadratic also reduces products of three variables.
+    '''
+    def variables(bqm):
+        return {variable for variable in bqm.variables if '*' not in str(variable)}
+    assert variables(a) == variables(b)
+    for seed in range(n_samples):
+        energy_a = a.energy(consistent_sample(a, seed))
+        energy_b = b.energy(consistent_sample(b, seed))
+        assert abs(energy_a - energy_b) / max(1.0, abs(energy_a)) < 1e-9
+
+@pytest.mark.parametrize('name', PROBLEMS)
+@pytest.mark.parametrize('n_replicas', [2, 3])
+@pytest.mark.parametrize('alpha', [0, 0.5])
+def test_numpy_max_cost_qubo_on_problems(name, n_replicas, alpha):
+    problem = PROBLEMS[name]
+    templates = list(range(len(problem.baseline)))
+    ones = [1 for _ in templates]
+    legacy = build_max_cost_qubo(legacy_make_max_cost_qubo, n_replicas, templates, [], problem.baseline, ones, problem.benefits, alpha)
+    vectorised = build_max_cost_qubo(make_max_cost_qubo, n_replicas, templates, [], problem.baseline, ones, problem.benefits,
+                                     alpha)
+    assert_same_energies(legacy, vectorised)
+
+@pytest.mark.parametrize('size', [3, 6])
+@pytest.mark.parametrize('alpha', [0, 0.5])
+def test_numpy_max_cost_qubo_on_synthetic_problems(size, alpha):
+    queries, updates, baseline, frequencies, benefits = synthetic_problem(size, 2 * size, size)
+    with warnings.catch_warnings():
+        # the synthetic update templates make Z_max loose, which is warned about
+        warnings.simplefilter('ignore', UserWarning)
+        legacy = build_max_cost_qubo(legacy_make_max_cost_qubo, 2, queries, updates, baseline, frequencies, benefits, alpha)
+        vectorised = build_max_cost_qubo(make_max_cost_qubo, 2, queries, updates, baseline, frequencies, benefits, alpha)
+    assert_same_energies(legacy, vectorised)
+
+@pytest.mark.parametrize('size', [2, 5])
+def test_closed_form_square(size):
+    constraint = load_constraint(size, 2 * size, size)
+    strength = 2.0 * max(abs(bias) for _, bias in constraint.iter_linear())
+    assert_same_energies(legacy_square(constraint, strength), square_constraint(constraint, strength))
+
+@pytest.mark.parametrize('basis', ['max', 'total'])
+@pytest.mark.parametrize('alpha', [0, 0.5])
+def test_zero_benefit_interactions(basis, alpha):
+    queries, updates, baseline, frequencies, benefits = synthetic_problem(6, 12, 6)
+    # a candidate that slows no update template down, and a template without a cost
+    benefits[0] = [benefit if t in queries else 0 for t, benefit in enumerate(benefits[0])]
+    baseline[queries[0]] = 0
+    sparse = BenefitMatrix.from_rows(benefits)
+    candidates = list(range(len(benefits)))
+
+    def interactions(v):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            if basis == 'max':
+                Z_max = max(1, omega(queries, updates, candidates, baseline, frequencies, 3))
+                return make_max_cost_qubo(Z_max, 3, queries, updates, candidates, baseline, frequencies, v, 1, alpha)[0].num_interactions
+            return make_total_cost_qubo(3, queries, updates, candidates, baseline, frequencies, v, 1)[0].num_interactions
+
+    assert sparse.nnz < sparse.densified().nnz
+    assert interactions(sparse.densified()) == interactions(sparse) + \
+        zero_benefit_interactions(3, queries, updates, candidates, baseline, frequencies, sparse, alpha, basis)
@@ -0,0 +1,24 @@
+import sys
+
+import pytest
+from dimod import RandomSampler
+
+import run
+
+@pytest.mark.parametrize('basis', ['max', 'total'])
+@pytest.mark.parametrize('options', [[], ['--presolve'], ['--alpha', '0.2']])
+def test_decode_a_sample(basis, options, tmp_path, monkeypatch, capsys):
+    '''
+    Build the QUBO of a precomputed problem, sample it at random in place of
+    the annealer, and decode the best sample.
+    '''
+    (tmp_path / 'replicas.csv').write_text('1,localhost,5432,db,user,\n2,localhost,5432,db,user,\n')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, 'argv', ['run.py', '-p', 'QAOA_TOY_MAX', *options, basis])
+    monkeypatch.setattr(run, 'anneal', lambda qubo, *_: RandomSampler().sample(qubo, num_reads=10, seed=0))
+    monkeypatch.setattr(run, 'args', run.create_arguments(), raising=False)
+    with pytest.raises(SystemExit):
+        run.optimise(run.args)
+    output = capsys.readouterr().out
+    assert 'objective (z)' in output
+    assert '- Replica 0' in output and '- Replica 1' in output
@@ -0,0 +1,76 @@
+import re
+from dataclasses import dataclass
+
+IDENTIFIER_REGEX = r'[a-z_][a-z0-9_$]*'
+
+# statements that can be costed with EXPLAIN
+EXPLAINABLE = ('select', 'update', 'insert', 'delete')
+
+@dataclass
+class CompiledQuery:
+    '''
+    One workload query, split into statements and classified once so that
+    the estimator passes do not have to re-parse the raw text.
+
+    The views a query creates are renamed with a per-query suffix, so the
+    `setup` of every query in the workload can be run once at the start of a
+    session and left in place while the query is costed many times.
+    '''
+    text: str
+    template: int
+    # CREATE VIEW statements, as idempotent temporary views
+    setup: tuple
+    # (cache key, statement) for every statement to EXPLAIN
+    statements: tuple
+    tables: frozenset
+    # every identifier in the query, which includes the columns it references
+    identifiers: frozenset = frozenset()
+    # how many times the statement occurs in the workload
+    frequency: int = 1
+
+def rename_identifier(text: str, old: str, new: str) -> str:
+    return re.sub(r'(?<![a-z0-9_$])%s(?![a-z0-9_$])' % re.escape(old), new, text)
+
+def compile_query(text: str, template: int, suffix: str, tables=(), frequency: int = 1) -> CompiledQuery:
+    '''
+    Split and classify one workload query.
+
+    :param text: the query text, as prepared by `update_query_text`
+    :param template: the template the query belongs to
+    :param suffix: appended to the names of the views the query creates;
+                   it must be unique within the workload
+    :param tables: the tables in the schema, to find the ones it references
+    :param frequency: how many times the query occurs in the workload
+    '''
+    lowered = text.lower()
+    views = re.findall(r'create\s+view\s+(%s)' % IDENTIFIER_REGEX, lowered)
+    setup = []
+    statements = []
+    # the cache key of a statement includes the view DDL that precedes it
+    ddl = []
+    for statement in lowered.split(';'):
+        renamed = statement
+        for view in views:
+            renamed = rename_identifier(renamed, view, f'{view}_{suffix}')
+        if 'create view' in statement:
+            setup.append(renamed.replace('create view', 'create or replace temporary view'))
+            ddl.append(statement)
+        elif 'drop view' in statement:
+            # the temporary views are left in place for the session
+            ddl.append(statement)
+        elif any(kind in statement for kind in EXPLAINABLE):
+            statements.append((';'.join(ddl + [statement]), renamed))
+    identifiers = frozenset(re.findall(IDENTIFIER_REGEX, lowered))
+    referenced = identifiers.intersection(tables)
+    return CompiledQuery(text, template, tuple(setup), tuple(statements), referenced, identifiers, frequency)
+
+def compile_workload(workload, templates, tables=(), frequencies=None) -> list[CompiledQuery]:
+    '''
+    Compile every query of a workload. The views of the query at index `i`
+    are suffixed with `q{i}`.
+
+    :param frequencies: how many times each query occurs, or None if every
+                        query occurs once
+    '''
+    frequencies = frequencies or [1 for _ in workload]
+    return [compile_query(query, templates[i], f'q{i}', tables, frequencies[i]) for i, query in enumerate(workload)]